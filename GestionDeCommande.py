@@ -1,29 +1,471 @@
 import sqlite3
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, Toplevel
-import pyperclip
-import qrcode
-from PIL import ImageTk
 import socket
 import threading
-import json
-from flask import Flask, render_template, request
-from flask_socketio import SocketIO, emit
 import os
 from tkinter import filedialog
-import pandas as pd
+import tkinter.font as tkfont
 import sys
 import logging
 import traceback
-import openpyxl
+import queue
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
-# Configure logging
-logging.basicConfig(
-    filename='app.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+from ServiceCommandes import (
+    F1_COLUMNS, CatalogueExporter, CatalogueImporter, OrderStore, ServiceCommandes,
+    element_price_cents, format_cents, get_resource_path, load_settings, metrics, setup_logging
 )
 
+# The catalogue, orders and phone server live in ServiceCommandes; this module
+# is the Tk window. qrcode, PIL and pyperclip are imported where first needed.
+
+
+class StartupTimer:
+    """Times the startup phases and logs one report once they are all known."""
+
+    def __init__(self, phases):
+        self.started = time.perf_counter()
+        self.phases = list(phases)
+        self.durations = OrderedDict()
+        self.reported = False
+        self._starts = {}
+
+    @contextmanager
+    def phase(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def start(self, name):
+        self._starts.setdefault(name, time.perf_counter())
+
+    def stop(self, name):
+        if name in self.durations or name not in self._starts:
+            return
+        self.durations[name] = time.perf_counter() - self._starts.pop(name)
+        if not self.reported and all(phase in self.durations for phase in self.phases):
+            self.reported = True
+            report = ", ".join(f"{phase}={self.durations[phase] * 1000:.0f}ms" for phase in self.phases)
+            total = (time.perf_counter() - self.started) * 1000
+            logging.info(f"Startup timing: {report}, total={total:.0f}ms")
+
+
+class ListRowSource:
+    """Row source over rows already held in memory."""
+
+    def __init__(self, rows, approximate=False):
+        self.rows = rows
+        # Rows found by the typo-tolerant search
+        self.approximate = approximate
+
+    def count(self):
+        return len(self.rows)
+
+    def fetch(self, offset, limit):
+        return self.rows[offset:offset + limit]
+
+
+class QueryRowSource:
+    """Row source paging the F1 rows matching a search straight from SQLite.
+
+    Rows are read in pages of page_size with LIMIT/OFFSET, or by keyset on id
+    when the previous page is known and the order is by id. Only the most
+    recently used pages are kept. The row count is a single COUNT(*) query.
+    """
+
+    def __init__(self, db, search_index, search_text, order_by="id", page_size=100, max_pages=8):
+        self.db = db
+        self.search_index = search_index
+        self.search_text = search_text
+        self.order_by = order_by
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.use_fts = search_index.fts_enabled
+        self._count = None
+        self._pages = OrderedDict()
+
+    def _execute(self, make_query):
+        where, params = self.search_index.build_where(self.search_text, self.use_fts)
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(*make_query(where, params))
+            except sqlite3.OperationalError as e:
+                if not self.use_fts:
+                    raise
+                logging.warning(f"FTS query failed, falling back to LIKE search: {e}")
+                self.use_fts = False
+                where, params = self.search_index.build_where(self.search_text, self.use_fts)
+                cursor.execute(*make_query(where, params))
+            return cursor.fetchall()
+
+    def count(self):
+        if self._count is None:
+            def make_query(where, params):
+                where_clause = f" WHERE {where}" if where else ""
+                return f"SELECT COUNT(*) FROM F1{where_clause}", params
+            self._count = self._execute(make_query)[0][0]
+        return self._count
+
+    def fetch(self, offset, limit):
+        if limit <= 0:
+            return []
+        first = offset // self.page_size
+        last = (offset + limit - 1) // self.page_size
+        rows = []
+        for page in range(first, last + 1):
+            rows.extend(self._page(page))
+        start = offset - first * self.page_size
+        return rows[start:start + limit]
+
+    def _page(self, page):
+        if page in self._pages:
+            self._pages.move_to_end(page)
+            return self._pages[page]
+
+        previous = self._pages.get(page - 1)
+        if self.order_by == "id" and previous:
+            # Keyset pagination: continue after the last id of the previous page
+            def make_query(where, params):
+                conditions = f"({where}) AND id > ?" if where else "id > ?"
+                return (
+                    f"SELECT {F1_COLUMNS} FROM F1 WHERE {conditions} ORDER BY id LIMIT ?",
+                    params + [previous[-1][0], self.page_size]
+                )
+        else:
+            def make_query(where, params):
+                where_clause = f" WHERE {where}" if where else ""
+                return (
+                    f"SELECT {F1_COLUMNS} FROM F1{where_clause} ORDER BY {self.order_by} LIMIT ? OFFSET ?",
+                    params + [self.page_size, page * self.page_size]
+                )
+
+        rows = self._execute(make_query)
+        self._pages[page] = rows
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return rows
+
+
+class VirtualScroller:
+    """Shows only the visible window of a row source in a Listbox or Treeview.
+
+    The widget holds the visible rows plus a small overscan; the scrollbar and
+    the mouse wheel move the window over the source instead of scrolling a
+    fully populated widget.
+    """
+
+    def __init__(self, widget, scrollbar, format_row, on_count=None, overscan=5):
+        self.widget = widget
+        self.scrollbar = scrollbar
+        self.format_row = format_row
+        self.on_count = on_count
+        self.overscan = overscan
+        self.source = ListRowSource([])
+        self.offset = 0
+        self.rows = []
+        self.is_listbox = isinstance(widget, tk.Listbox)
+
+        if self.is_listbox:
+            self.row_height = tkfont.Font(font=widget.cget('font')).metrics('linespace') + 1
+        else:
+            self.row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+
+        scrollbar.configure(command=self.yview)
+        widget.bind('<MouseWheel>', self._on_mousewheel)
+        widget.bind('<Button-4>', lambda e: self.yview('scroll', -3, 'units'))
+        widget.bind('<Button-5>', lambda e: self.yview('scroll', 3, 'units'))
+        widget.bind('<Prior>', lambda e: self.yview('scroll', -1, 'pages'))
+        widget.bind('<Next>', lambda e: self.yview('scroll', 1, 'pages'))
+        widget.bind('<Configure>', lambda e: self.refresh())
+
+    def set_source(self, source, keep_offset=False):
+        self.source = source
+        if not keep_offset:
+            self.offset = 0
+        if self.on_count:
+            self.on_count(source.count())
+        self.refresh()
+
+    def visible_count(self):
+        height = self.widget.winfo_height()
+        if height <= 1:
+            # Not mapped yet
+            return int(self.widget.cget('height'))
+        if not self.is_listbox:
+            height -= self.row_height  # headings
+        return max(1, height // self.row_height)
+
+    def yview(self, *args):
+        visible = self.visible_count()
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * self.source.count())
+        elif args[0] == 'scroll':
+            step = visible if args[2] == 'pages' else 1
+            self.offset += int(args[1]) * step
+        self.refresh()
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        return self.yview('scroll', -3 if event.delta > 0 else 3, 'units')
+
+    def selected_indices(self):
+        """Positions of the selected rows within the materialized window."""
+        if self.is_listbox:
+            return list(self.widget.curselection())
+        children = self.widget.get_children()
+        return [children.index(item) for item in self.widget.selection()]
+
+    def row_at(self, index):
+        return self.rows[index]
+
+    def refresh(self):
+        total = self.source.count()
+        visible = self.visible_count()
+        selected = [self.offset + i for i in self.selected_indices()]
+        self.offset = max(0, min(self.offset, total - visible))
+        self.rows = self.source.fetch(self.offset, visible + self.overscan)
+
+        if self.is_listbox:
+            self.widget.delete(0, tk.END)
+            if self.rows:
+                self.widget.insert(tk.END, *[self.format_row(row) for row in self.rows])
+            for index in selected:
+                if 0 <= index - self.offset < len(self.rows):
+                    self.widget.selection_set(index - self.offset)
+        else:
+            self.widget.delete(*self.widget.get_children())
+            items = [self.widget.insert("", "end", values=self.format_row(row)) for row in self.rows]
+            self.widget.selection_set([
+                items[index - self.offset] for index in selected
+                if 0 <= index - self.offset < len(items)
+            ])
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+class SearchScheduler:
+    """Debounces search keystrokes and runs the queries on a worker thread.
+
+    Every submitted search gets a new generation number. A query that is
+    superseded while it runs is interrupted, and only the result of the latest
+    generation is handed back to the Tk thread through root.after(). A search
+    that raises is logged and reported with on_error(search_text) instead.
+    """
+
+    def __init__(self, root, db, search_func, on_results, delay_ms=250, on_error=None):
+        self.root = root
+        self.db = db
+        self.search_func = search_func
+        self.on_results = on_results
+        self.on_error = on_error
+        self.delay_ms = delay_ms
+
+        self.generation = 0
+        self.skipped_count = 0
+        self._after_id = None
+        self._last_text = None
+        self._pending = None
+        self._running_generation = None
+        self._condition = threading.Condition()
+
+        self._worker_conn = None
+        self._worker = threading.Thread(target=self._run, name="search-worker", daemon=True)
+        self._worker.start()
+
+    def schedule(self, search_text):
+        """Queue a search for after the debounce delay (Tk thread only)."""
+        if search_text == self._last_text:
+            return
+        self._last_text = search_text
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self.skipped_count += 1
+            metrics.inc("search_skipped_total")
+        self._after_id = self.root.after(self.delay_ms, self._submit, search_text)
+
+    def run_now(self, search_text):
+        """Run a search without waiting for the debounce delay."""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._last_text = search_text
+        self._submit(search_text)
+
+    def _submit(self, search_text):
+        self._after_id = None
+        with self._condition:
+            self.generation += 1
+            if self._pending is not None:
+                self.skipped_count += 1
+                metrics.inc("search_skipped_total")
+            self._pending = (self.generation, search_text)
+            if self._running_generation is not None and self._worker_conn is not None:
+                self._worker_conn.interrupt()
+            self._condition.notify()
+
+    def _run(self):
+        # The worker keeps its pooled connection for its whole lifetime
+        self._worker_conn = self.db.acquire()
+        cursor = self._worker_conn.cursor()
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                generation, search_text = self._pending
+                self._pending = None
+                self._running_generation = generation
+
+            failed = False
+            try:
+                with metrics.timer("search_seconds"):
+                    results = self.search_func(cursor, search_text)
+            except sqlite3.OperationalError as e:
+                results = None
+                if "interrupted" not in str(e):
+                    logging.exception(f"Search failed for {search_text!r}")
+                    failed = True
+            except Exception:
+                # The worker must survive to answer the next keystrokes
+                results = None
+                logging.exception(f"Search failed for {search_text!r}")
+                failed = True
+            finally:
+                with self._condition:
+                    self._running_generation = None
+
+            with self._condition:
+                if generation != self.generation:
+                    self.skipped_count += 1
+                    metrics.inc("search_skipped_total")
+                    continue
+                if results is None and not failed:
+                    # Interrupted although still the latest request: run it again
+                    if self._pending is None:
+                        self._pending = (generation, search_text)
+                    continue
+            try:
+                self.root.after(0, self._deliver, generation, search_text, results, failed)
+            except (RuntimeError, tk.TclError):
+                # Main window already closed
+                break
+
+    def _deliver(self, generation, search_text, results, failed):
+        if generation != self.generation:
+            self.skipped_count += 1
+            metrics.inc("search_skipped_total")
+            return
+        if failed:
+            if self.on_error is not None:
+                self.on_error(search_text)
+            return
+        logging.debug(f"Search delivered, {self.skipped_count} queries skipped so far")
+        self.on_results(results)
+
+
+class OrderRowSource:
+    """Row source over the order history, newest first, optionally filtered by status."""
+
+    def __init__(self, db, status=None):
+        self.db = db
+        self.status = status
+        self._count = None
+
+    def _where(self):
+        if self.status is None:
+            return "", []
+        return " WHERE status = ?", [self.status]
+
+    def count(self):
+        if self._count is None:
+            where, params = self._where()
+            with self.db.connection() as conn:
+                self._count = conn.execute(f"SELECT COUNT(*) FROM orders{where}", params).fetchone()[0]
+        return self._count
+
+    def fetch(self, offset, limit):
+        if limit <= 0:
+            return []
+        where, params = self._where()
+        with self.db.connection() as conn:
+            return conn.execute(
+                f"SELECT id, name, status, created_at, updated_at FROM orders{where} "
+                f"ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+
+
+class ProgressDialog:
+    """Progress window for a long task running on a worker thread.
+
+    The task receives a progress(done, total, message) callback that can be
+    called from the worker; updates reach the Tk thread through a queue
+    polled with after().
+    """
+
+    def __init__(self, parent, title):
+        self.window = Toplevel(parent)
+        self.window.title(title)
+        self.window.geometry("420x110")
+        self.window.transient(parent)
+        self.window.protocol("WM_DELETE_WINDOW", lambda: None)
+
+        self.label = ttk.Label(self.window, text="")
+        self.label.pack(fill="x", padx=20, pady=(20, 5))
+        self.progressbar = ttk.Progressbar(self.window, mode="indeterminate", length=380)
+        self.progressbar.pack(padx=20, pady=5)
+        self.progressbar.start()
+
+        self.queue = queue.Queue()
+        self.window.grab_set()
+
+    def progress(self, done, total=None, message=None):
+        self.queue.put(('progress', (done, total, message)))
+
+    def run(self, task, on_success, on_error):
+        def worker():
+            try:
+                self.queue.put(('done', task(self.progress)))
+            except Exception as e:
+                logging.error(traceback.format_exc())
+                self.queue.put(('error', e))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self._poll(on_success, on_error)
+
+    def _poll(self, on_success, on_error):
+        try:
+            while True:
+                kind, payload = self.queue.get_nowait()
+                if kind == 'progress':
+                    done, total, message = payload
+                    if message:
+                        self.label.configure(text=message)
+                    if total:
+                        if str(self.progressbar.cget('mode')) != 'determinate':
+                            self.progressbar.stop()
+                            self.progressbar.configure(mode='determinate', maximum=total)
+                        self.progressbar.configure(value=done)
+                else:
+                    self.window.grab_release()
+                    self.window.destroy()
+                    if kind == 'done':
+                        on_success(payload)
+                    else:
+                        on_error(payload)
+                    return
+        except queue.Empty:
+            pass
+        self.window.after(100, self._poll, on_success, on_error)
+
 
 class QuantityDialog(simpledialog.Dialog):
     def __init__(self, parent, title="", prompt="", initialvalue=None, minvalue=None, maxvalue=None):
@@ -54,7 +496,7 @@ class QuantityDialog(simpledialog.Dialog):
             return False
 
 class DatabaseManagerWindow:
-    def __init__(self, app, db_connection):
+    def __init__(self, app, db):
         # Changed parent to app to get access to the main application instance
         self.app = app  
         self.window = Toplevel(app.root)
@@ -64,8 +506,7 @@ class DatabaseManagerWindow:
         if hasattr(app, 'small_icon'):
             self.window.iconphoto(False, app.small_icon)
             
-        self.conn = db_connection
-        self.cursor = self.conn.cursor()
+        self.db = db
         self.setup_gui()
 
     def setup_gui(self):
@@ -86,6 +527,8 @@ class DatabaseManagerWindow:
         self.search_entry = ttk.Entry(search_frame)
         self.search_entry.pack(side="left", padx=5)
         self.search_entry.bind("<KeyRelease>", self.search_database)
+        self.count_label = ttk.Label(search_frame, text="")
+        self.count_label.pack(side="left", padx=5)
         
         # Left buttons on same line
         ttk.Button(left_btn_frame, text="Ajouter", command=self.add_item).pack(side="left", padx=5)
@@ -104,8 +547,13 @@ class DatabaseManagerWindow:
         
         # Rest of the GUI setup
         self.tree = ttk.Treeview(main_frame, columns=("ID", "Description", "Type", "Prix", "Marque"), show="headings")
-        scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(main_frame, orient="vertical")
+        self.view = VirtualScroller(
+            self.tree,
+            scrollbar,
+            lambda row: row[:5],
+            on_count=lambda count: self.count_label.configure(text=f"{count} articles")
+        )
         
         # Configure columns
         self.tree.heading("Marque", text="Marque")
@@ -128,27 +576,29 @@ class DatabaseManagerWindow:
 
         self.load_data()
 
-    def load_data(self):
-        self.tree.delete(*self.tree.get_children())
-        self.cursor.execute("SELECT * FROM F1 ORDER BY id")
-        for row in self.cursor.fetchall():
-            self.tree.insert("", "end", values=row)
+    def load_data(self, keep_offset=True):
+        search_text = self.search_entry.get().strip().upper()
+        self.view.set_source(
+            QueryRowSource(self.db, self.app.search_index, search_text, order_by="id"),
+            keep_offset=keep_offset
+        )
 
     def add_item(self):
         dialog = ItemDialog(self.window, "Ajouter un élément")
         if dialog.result:
             try:
-                self.cursor.execute(
-                    "INSERT INTO F1 (id, description, type, prix, marque) VALUES (?, ?, ?, ?, ?)",
-                    (
-                        dialog.result[0],  # id
-                        dialog.result[1],  # description
-                        dialog.result[2],  # type
-                        dialog.result[3],  # prix
-                        dialog.result[4]   # marque
+                with self.db.transaction() as conn:
+                    conn.execute(
+                        "INSERT INTO F1 (id, description, type, prix, marque) VALUES (?, ?, ?, ?, ?)",
+                        (
+                            dialog.result[0],  # id
+                            dialog.result[1],  # description
+                            dialog.result[2],  # type
+                            dialog.result[3],  # prix
+                            dialog.result[4]   # marque
+                        )
                     )
-                )
-                self.conn.commit()
+                self.app.on_catalogue_changed()
                 self.load_data()
             except sqlite3.Error as e:
                 messagebox.showerror("Erreur", f"Erreur lors de l'ajout : {str(e)}")
@@ -163,11 +613,12 @@ class DatabaseManagerWindow:
         dialog = ItemDialog(self.window, "Modifier l'élément", item['values'])
         if dialog.result:
             try:
-                self.cursor.execute(
-                    "UPDATE F1 SET id=?, description=?, type=?, prix=?, marque=? WHERE id=?",
-                    (*dialog.result, item['values'][0])
-                )
-                self.conn.commit()
+                with self.db.transaction() as conn:
+                    conn.execute(
+                        "UPDATE F1 SET id=?, description=?, type=?, prix=?, marque=? WHERE id=?",
+                        (*dialog.result, item['values'][0])
+                    )
+                self.app.on_catalogue_changed()
                 self.load_data()
             except sqlite3.Error as e:
                 messagebox.showerror("Erreur", f"Erreur lors de la modification : {str(e)}")
@@ -191,104 +642,87 @@ class DatabaseManagerWindow:
                 return
                 
             # Delete from database
-            self.cursor.execute("DELETE FROM F1 WHERE id=?", (item_id,))
-            self.conn.commit()
-            
-            # Delete from treeview
-            self.tree.delete(selected_item[0])
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM F1 WHERE id=?", (item_id,))
+            self.app.on_catalogue_changed()
+            self.load_data()
             
         except Exception as e:
             messagebox.showerror("Erreur", f"Erreur lors de la suppression: {str(e)}")
 
     def search_database(self, event=None):
-        search_text = self.search_entry.get().strip().upper()
-        
-        self.tree.delete(*self.tree.get_children())
-        
-        if not search_text:
-            self.cursor.execute("SELECT * FROM F1 ORDER BY id")
-        else:
-            keywords = search_text.split()
-            conditions = []
-            params = []
-            
-            for keyword in keywords:
-                conditions.append("(UPPER(description) LIKE ? OR UPPER(type) LIKE ? OR UPPER(marque) LIKE ?)")
-                params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
-                
-            query = f"""
-                SELECT * FROM F1 
-                WHERE {' AND '.join(conditions)}
-                ORDER BY id
-            """
-            self.cursor.execute(query, params)
-
-        for row in self.cursor.fetchall():
-            self.tree.insert("", "end", values=row)
+        self.load_data(keep_offset=False)
 
     def export_to_excel(self):
-        try:
-            import pandas as pd
-            
-            # Get all data from database
-            self.cursor.execute("SELECT * FROM F1")
-            data = self.cursor.fetchall()
-            
-            # Create DataFrame
-            df = pd.DataFrame(data, columns=['ID', 'Description', 'Type', 'Prix', 'Marque'])
-            
-            # Ask for save location
-            file_path = filedialog.asksaveasfilename(
-                defaultextension='.xlsx',
-                filetypes=[("Excel files", "*.xlsx")],
-                title="Exporter la base de données"
+        search_text = ""
+        if self.search_entry.get().strip():
+            filtered = messagebox.askyesnocancel(
+                "Export",
+                "Exporter uniquement les résultats de la recherche actuelle ?",
+                parent=self.window
             )
-            
-            if file_path:
-                df.to_excel(file_path, index=False)
-                messagebox.showinfo("Succès", "Base de données exportée avec succès!")
-                
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Erreur lors de l'export: {str(e)}")
-    
+            if filtered is None:
+                return
+            if filtered:
+                search_text = self.search_entry.get().strip().upper()
+
+        # Ask for save location
+        file_path = filedialog.asksaveasfilename(
+            defaultextension='.xlsx',
+            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("Parquet files", "*.parquet")],
+            title="Exporter la base de données"
+        )
+        if not file_path:
+            return
+
+        def on_success(exported):
+            messagebox.showinfo(
+                "Succès",
+                f"Base de données exportée avec succès! ({exported} lignes)",
+                parent=self.window
+            )
+
+        def on_error(error):
+            messagebox.showerror("Erreur", f"Erreur lors de l'export: {str(error)}", parent=self.window)
+
+        dialog = ProgressDialog(self.window, "Export en cours")
+        exporter = CatalogueExporter(self.db, self.app.search_index, search_text, progress=dialog.progress)
+        dialog.run(lambda progress: exporter.run(file_path), on_success, on_error)
+
     def import_from_excel(self):
-        try:
-            import pandas as pd
-            
-            # Ask for file location
-            file_path = filedialog.askopenfilename(
-                filetypes=[("Excel files", "*.xlsx")],
-                title="Importer une base de données"
+        file_path = filedialog.askopenfilename(
+            filetypes=[("Excel ou CSV", "*.xlsx *.csv"), ("Excel files", "*.xlsx"), ("CSV files", "*.csv")],
+            title="Importer une base de données"
+        )
+        if not file_path:
+            return
+
+        delete_missing = messagebox.askyesnocancel(
+            "Import",
+            "Supprimer les articles de la base absents du fichier ?"
+        )
+        if delete_missing is None:
+            return
+
+        def on_success(summary):
+            self.app.on_catalogue_changed()
+            self.load_data()
+            messagebox.showinfo(
+                "Succès",
+                f"Base de données importée avec succès!\n\n"
+                f"{summary['total']} lignes lues\n"
+                f"{summary['added']} ajoutées\n"
+                f"{summary['changed']} modifiées\n"
+                f"{summary['removed']} supprimées",
+                parent=self.window
             )
-            
-            if file_path:
-                # Read Excel file
-                df = pd.read_excel(file_path)
-                
-                # Clear existing data
-                self.cursor.execute("DELETE FROM F1")
-                
-                # Insert new data
-                for _, row in df.iterrows():
-                    self.cursor.execute("""
-                        INSERT INTO F1 (id, description, type, prix, marque) 
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        int(row['ID']),
-                        str(row['Description']),
-                        str(row['Type']),
-                        str(row['Prix']),
-                        str(row['Marque'])
-                    ))
-                
-                # Commit transaction
-                self.cursor.execute("COMMIT")
-                self.conn.commit()
-                self.load_data()
-                messagebox.showinfo("Succès", "Base de données importée avec succès!")
-                
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Erreur lors de l'import: {str(e)}")
+
+        def on_error(error):
+            messagebox.showerror("Erreur", f"Erreur lors de l'import: {str(error)}", parent=self.window)
+
+        dialog = ProgressDialog(self.window, "Import en cours")
+        importer = CatalogueImporter(self.db, delete_missing=delete_missing, progress=dialog.progress)
+        dialog.run(lambda progress: importer.run(file_path), on_success, on_error)
 
 class ItemDialog(simpledialog.Dialog):
     def __init__(self, parent, title, initial_values=None):
@@ -327,12 +761,91 @@ class ItemDialog(simpledialog.Dialog):
             messagebox.showerror("Erreur", "L'ID doit être un nombre entier")
             return False
 
+class OrdersWindow:
+    """Order history, read a page at a time, from which an order can be opened or closed."""
+
+    STATUS_FILTERS = {"Toutes": None, "En cours": "open", "Terminées": "closed"}
+
+    def __init__(self, app):
+        self.app = app
+        self.window = Toplevel(app.root)
+        self.window.title("Commandes")
+        self.window.geometry("900x500")
+        if hasattr(app, 'small_icon'):
+            self.window.iconphoto(False, app.small_icon)
+        self.setup_gui()
+
+    def setup_gui(self):
+        main_frame = ttk.Frame(self.window)
+        top_frame = ttk.Frame(main_frame)
+
+        ttk.Label(top_frame, text="Statut :").pack(side="left", padx=5)
+        self.status_combo = ttk.Combobox(
+            top_frame, values=list(self.STATUS_FILTERS), state="readonly", width=12
+        )
+        self.status_combo.set("En cours")
+        self.status_combo.bind("<<ComboboxSelected>>", lambda e: self.load_data(False))
+        self.status_combo.pack(side="left", padx=5)
+        self.count_label = ttk.Label(top_frame, text="")
+        self.count_label.pack(side="left", padx=5)
+
+        ttk.Button(top_frame, text="Rouvrir", command=lambda: self.set_status('open')).pack(side="right", padx=5)
+        ttk.Button(top_frame, text="Terminer", command=lambda: self.set_status('closed')).pack(side="right", padx=5)
+        ttk.Button(top_frame, text="Ouvrir", command=self.open_order).pack(side="right", padx=5)
+        top_frame.pack(fill="x", padx=10, pady=5)
+
+        columns = ("N°", "Nom", "Statut", "Créée le", "Modifiée le")
+        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", selectmode="browse")
+        for col in columns:
+            self.tree.heading(col, text=col)
+        self.tree.column("N°", width=60)
+        self.tree.column("Nom", width=340)
+        self.tree.column("Statut", width=100)
+        self.tree.column("Créée le", width=160)
+        self.tree.column("Modifiée le", width=160)
+        scrollbar = ttk.Scrollbar(main_frame, orient="vertical")
+        self.view = VirtualScroller(
+            self.tree,
+            scrollbar,
+            lambda row: (row[0], row[1], OrderStore.STATUS_LABELS.get(row[2], row[2]), row[3], row[4]),
+            on_count=lambda count: self.count_label.configure(text=f"{count} commandes")
+        )
+        self.tree.bind('<Double-Button-1>', lambda e: self.open_order())
+
+        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        self.load_data()
+
+    def load_data(self, keep_offset=True):
+        status = self.STATUS_FILTERS[self.status_combo.get()]
+        self.view.set_source(OrderRowSource(self.app.db, status), keep_offset=keep_offset)
+
+    def selected_order(self):
+        indices = self.view.selected_indices()
+        if not indices:
+            messagebox.showwarning("Attention", "Veuillez sélectionner une commande.", parent=self.window)
+            return None
+        return self.view.row_at(indices[0])
+
+    def open_order(self):
+        order = self.selected_order()
+        if order:
+            self.app.switch_order(order[0])
+
+    def set_status(self, status):
+        order = self.selected_order()
+        if order:
+            self.app.orders.set_status(order[0], status)
+            self.load_data()
+
+
 class GestionCommandes:
     def __init__(self):
-        # Database connection
-        self.conn = sqlite3.connect('DB.db')
-        self.cursor = self.conn.cursor()
-        
+        self.startup = StartupTimer(
+            ["db_open", "gui_build", "icon_loading", "cart_load", "first_search", "flask_setup"]
+        )
         # Enable high DPI awareness
         try:
             from ctypes import windll
@@ -340,105 +853,45 @@ class GestionCommandes:
         except:
             pass
             
-        self.panier = {}
-        self.setup_database()
-        self.setup_flask()
-        
+        # Catalogue, orders and phone server; the window shows its current order
+        with self.startup.phase("db_open"):
+            self.service = ServiceCommandes()
+        self.service.on_current_lines_changed = self.current_lines_changed
+        self.settings = self.service.settings
+        self.db = self.service.db
+        self.products = self.service.products
+        self.orders = self.service.orders
+        self.search_index = self.service.search_index
+        self.search_cache = self.service.search_cache
+        # Searches go through SQLite until the in-memory copy is built
+        if self.service.catalogue.enabled:
+            self.service.catalogue.start_build()
+
+        with self.startup.phase("gui_build"):
+            self.create_gui()
+
         self.icon_path = 'Logo_DN.ico'
-        self.setup_icon()
-        
-        self.create_gui()
-        self.load_cart()
+        with self.startup.phase("icon_loading"):
+            self.setup_icon()
 
-    def get_resource_path(self, relative_path):
-        try:
-            if hasattr(sys, '_MEIPASS'): 
-                # PyInstaller path
-                base_path = sys._MEIPASS
-            elif getattr(sys, 'frozen', False):
-                # cx_Freeze path
-                base_path = os.path.dirname(sys.executable)
-            else:
-                # Development path
-                base_path = os.path.abspath(os.path.dirname(__file__))
-            return os.path.join(base_path, relative_path)
-        except Exception as e:
-            print(f"Error getting resource path: {e}")
-            return relative_path
+        with self.startup.phase("cart_load"):
+            self.load_cart()
 
     def setup_icon(self):
         try:
-            icon_path = self.get_resource_path("Logo_DN.png")
+            icon_path = get_resource_path("Logo_DN.png")
             print(f"Looking for icon at: {icon_path}")
             
             if os.path.exists(icon_path):
-                self.icon = ImageTk.PhotoImage(file=icon_path)
+                # Tk reads PNG natively, no need to load PIL at startup
+                self.icon = tk.PhotoImage(file=icon_path)
                 self.root.iconphoto(False, self.icon)
-                self.small_icon = ImageTk.PhotoImage(file=icon_path)
+                self.small_icon = tk.PhotoImage(file=icon_path)
             else:
                 print(f"Icon file not found at: {icon_path}")
         except Exception as e:
             print(f"Error loading icon: {e}")
 
-    def setup_database(self):
-        db_exists = os.path.exists('DB.db')
-        self.conn = sqlite3.connect('DB.db')
-        self.cursor = self.conn.cursor()
-        
-        # Create table if it doesn't exist
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS F1 (
-                id INTEGER PRIMARY KEY,
-                description TEXT,
-                type TEXT,
-                prix TEXT,
-                marque TEXT
-            )
-        ''')
-        self.conn.commit()
-
-    def setup_flask(self):
-        template_folder = self.get_resource_path(".")
-        self.app = Flask(__name__, template_folder=template_folder)
-        self.socketio = SocketIO(
-            self.app, 
-            cors_allowed_origins="*",
-            async_mode='threading'
-        )
-        self.clients = set()
-
-        @self.app.route('/')
-        def index():
-            return render_template('templates/edit_order.html')
-
-        @self.socketio.on('connect')
-        def handle_connect():
-            self.clients.add(request.sid)
-            emit('panier_update', self.panier, to=request.sid)
-
-        @self.socketio.on('disconnect')
-        def handle_disconnect():
-            self.clients.remove(request.sid)
-
-        @self.socketio.on('update_panier')
-        def handle_panier_update(data):
-            try:
-                id_produit = str(data['id'])
-                if data['quantite'] == 0:
-                    self.panier.pop(id_produit, None)
-                else:
-                    self.panier[id_produit] = {
-                        'element': data['element'],
-                        'quantite': int(data['quantite'])
-                    }
-                self.save_cart()
-                # Broadcast to all connected clients
-                for client in self.clients:
-                    emit('panier_update', self.panier, to=client)
-                self.update_cart_display()
-            except Exception as e:
-                print(f"Erreur: {e}")
-
     def create_gui(self):
         self.root = tk.Tk()
         self.root.title("Gestion de commandes")
@@ -467,10 +920,24 @@ class GestionCommandes:
         self.setup_styles()
         self.setup_gui_elements()
         self.setup_grid_layout()
-        self.search()
+
+        self.search_scheduler = SearchScheduler(
+            self.root,
+            self.db,
+            self.run_search,
+            self.display_results,
+            delay_ms=self.settings["search_debounce_ms"],
+            on_error=self.search_failed
+        )
+        self.startup.start("first_search")
+        self.search_scheduler.run_now("")
         
         self.treeview_panier.bind('<Button-3>', self.show_context_menu)
 
+        # Cart updates coming from the Socket.IO threads
+        self.ui_queue = queue.Queue()
+        self.root.after(50, self.drain_ui_queue)
+
     def setup_styles(self):
         style = ttk.Style()
         # theme
@@ -541,6 +1008,15 @@ class GestionCommandes:
             highlightcolor='#dee2e6'
         )
         
+        self.scrollbar_resultats = ttk.Scrollbar(self.root, orient="vertical")
+        self.label_resultats = ttk.Label(self.root, text="")
+        self.result_view = VirtualScroller(
+            self.listbox_resultats,
+            self.scrollbar_resultats,
+            self.format_result,
+            on_count=lambda count: self.label_resultats.configure(text=f"{count} résultats")
+        )
+
         # Add double-click binding to listbox
         self.listbox_resultats.bind('<Double-Button-1>', self.add_to_cart)
         
@@ -586,72 +1062,68 @@ class GestionCommandes:
 
         # Layout elements
         ttk.Label(self.root, text="Rechercher :").grid(row=0, column=0, sticky='w', padx=5)
+        ttk.Button(self.root, text="Commandes", command=self.show_orders).grid(row=0, column=1, padx=5)
+        self.label_resultats.grid(row=0, column=2, sticky='e', padx=5)
         self.entry_valeur.grid(row=1, column=0, columnspan=3, sticky='ew', padx=5)
         
         self.listbox_resultats.grid(row=4, column=0, columnspan=3, sticky='nsew', padx=5, pady=5)
+        self.scrollbar_resultats.grid(row=4, column=3, sticky='ns', pady=5)
         self.treeview_panier.grid(row=5, column=0, columnspan=3, sticky='nsew', padx=5, pady=5)
         
         ttk.Button(self.root, text="Afficher QR Code", command=self.show_qr_code).grid(
             row=6, column=0, pady=10, padx=5)
         ttk.Button(self.root, text="Copier la commande", command=self.copy_cart).grid(
             row=6, column=1, pady=10, padx=5)
-        ttk.Button(self.root, text="Nouvelle commande", command=self.reset_cart).grid(
+        ttk.Button(self.root, text="Nouvelle commande", command=self.new_order).grid(
             row=6, column=2, pady=10, padx=5)
 
+    @property
+    def panier(self):
+        """Lines of the order shown on the desktop."""
+        return self.service.panier
+
     def load_cart(self):
-        try:
-            with open('panier.json', 'r') as f:
-                content = f.read()
-                if content.strip():
-                    self.panier = json.loads(content)
-                else:
-                    self.panier = {}
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("Initializing empty cart")
-            self.panier = {}
-        self.update_cart_display()
+        # Reopen the most recent order still in progress
+        self.switch_order(self.service.resume_order())
 
-    def save_cart(self):
-        try:
-            with open('panier.json', 'w') as f:
-                json.dump(self.panier, f, indent=2)
-        except Exception as e:
-            print(f"Error saving cart: {e}")
-            messagebox.showerror("Error", "Could not save cart")
+    def switch_order(self, order_id):
+        """Show another order on the desktop."""
+        self.service.set_current_order(order_id)
+        name = self.orders.get(order_id)[1]
+        self.root.title(f"Gestion de commandes - {name}")
+        self.update_cart_display()
 
     def search(self, _=None):
         search_text = self.entry_valeur.get().strip().upper()
-        
-        if not search_text:
-            query = "SELECT * FROM F1"
-            self.cursor.execute(query)
-        else:
-            keywords = search_text.split()
-            conditions = []
-            params = []
-            
-            for keyword in keywords:
-                conditions.append("(UPPER(description) LIKE ? OR UPPER(type) LIKE ? OR UPPER(marque) LIKE ?)")
-                params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
-                
-            query = f"""
-                SELECT * FROM F1 
-                WHERE {' AND '.join(conditions)}
-            """
-            self.cursor.execute(query, params)
-
-        results = sorted(
-            self.cursor.fetchall(),
-            key=lambda x: float(x[3].replace("€", "").replace(",", ".").strip())
-        )
+        self.search_scheduler.schedule(search_text)
+
+    def run_search(self, cursor, search_text):
+        # Runs on the search worker thread
+        source = self.service.catalogue.search(cursor, search_text)
+        if source is None:
+            if not search_text.split():
+                # The whole catalogue is paged from SQLite by the Tk thread
+                return QueryRowSource(self.db, self.search_index, "", order_by="prix_cents, id")
+            source = ListRowSource(self.search_cache.search(cursor, search_text, order_by="prix_cents, id"))
+        if not source.count() and search_text.split() and self.settings["fuzzy_search"]:
+            # Probably a typo: closest products, best first
+            return ListRowSource(self.service.fuzzy_index.search(cursor, search_text), approximate=True)
+        return source
 
-        self.listbox_resultats.delete(0, tk.END)
-        for row in results:
-            marque = row[4] if len(row) > 4 else ""
-            display_text = f"{marque} - {row[1]} ({row[2]}): {row[3]}"
-            self.listbox_resultats.insert(tk.END, display_text)
+    def display_results(self, source):
+        self.result_view.set_source(source)
+        if getattr(source, 'approximate', False):
+            self.label_resultats.configure(text=f"{source.count()} résultats approchés")
+        self.startup.stop("first_search")
 
-        self.results_data = results
+    def search_failed(self, search_text):
+        self.result_view.set_source(ListRowSource([]))
+        self.label_resultats.configure(text="Erreur de recherche")
+        self.startup.stop("first_search")
+
+    def format_result(self, row):
+        marque = row[4] if len(row) > 4 else ""
+        return f"{marque} - {row[1]} ({row[2]}): {row[3]}"
 
     def add_to_cart(self, event=None):
         selection = self.listbox_resultats.curselection()
@@ -659,7 +1131,7 @@ class GestionCommandes:
             messagebox.showwarning(" ", "Veuillez sélectionner un élément.")
             return
 
-        element = self.results_data[selection[0]]
+        element = self.result_view.row_at(selection[0])
         dialog = QuantityDialog(
             self.root,
             prompt="Entrez la quantité :",
@@ -670,17 +1142,8 @@ class GestionCommandes:
         if not quantity:
             return
 
-        id_produit = str(element[0])
-        element_data = list(element)  
-        
-        if id_produit in self.panier:
-            self.panier[id_produit]['quantite'] += quantity
-        else:
-            self.panier[id_produit] = {'element': element_data, 'quantite': quantity}
-        
-        self.save_cart()
-        self.socketio.emit('panier_update', self.panier, room=None)
-        self.update_cart_display()
+        if not self.service.add_cart_quantity(str(element[0]), quantity):
+            messagebox.showwarning(" ", "Ce produit n'existe plus dans la base.")
 
     def show_quantity_dialog(self, event):
         item = self.treeview_panier.identify_row(event.y)
@@ -700,15 +1163,11 @@ class GestionCommandes:
         )
         quantity = dialog.result
 
-        if quantity is not None:
+        if quantity is not None and id_produit in self.panier:
             if quantity == 0:
-                del self.panier[id_produit]
+                self.service.set_cart_line(id_produit, None)
             else:
-                self.panier[id_produit]['quantite'] = quantity
-            
-            self.save_cart()
-            self.socketio.emit('panier_update', self.panier, broadcast=True)
-            self.update_cart_display()
+                self.service.set_cart_line(id_produit, dict(self.panier[id_produit], quantite=quantity))
 
     def show_context_menu(self, event):
         item = self.treeview_panier.identify_row(event.y)
@@ -728,56 +1187,104 @@ class GestionCommandes:
         )
         quantity = dialog.result
 
-        if quantity is not None:
+        if quantity is not None and id_produit in self.panier:
             if quantity == 0:
-                del self.panier[id_produit]
+                self.service.set_cart_line(id_produit, None)
             else:
-                self.panier[id_produit]['quantite'] = quantity
-            
-            self.save_cart()
-            # Correction de l'émission socketio
-            self.socketio.emit('panier_update', self.panier, room=None)
-            self.update_cart_display()
+                self.service.set_cart_line(id_produit, dict(self.panier[id_produit], quantite=quantity))
+
+    def call_in_ui(self, func, *args):
+        """Run func on the Tk thread; calls from other threads are queued."""
+        if threading.current_thread() is threading.main_thread():
+            func(*args)
+        else:
+            self.ui_queue.put((func, args))
+
+    def current_lines_changed(self, ids):
+        for id_produit in ids:
+            self.call_in_ui(self.refresh_cart_line, id_produit)
+
+    def drain_ui_queue(self):
+        try:
+            while True:
+                func, args = self.ui_queue.get_nowait()
+                func(*args)
+        except queue.Empty:
+            pass
+        except Exception as e:
+            logging.error(f"UI update failed: {e}")
+            logging.error(traceback.format_exc())
+        self.root.after(50, self.drain_ui_queue)
 
     def update_cart_display(self):
+        # Full rebuild, used when the whole cart is replaced
+        started = time.perf_counter()
         self.treeview_panier.delete(*self.treeview_panier.get_children())
-        total_sum = 0.0
-        
-        for item in self.panier.values():
-            element = item['element']
-            quantity = item['quantite']
-            price = float(element[3].replace("€", "").replace(",", "."))
-            total = quantity * price
-            total_sum += total
-            
-            # Add safe access to marque with fallback
-            try:
-                marque = element[4] if len(element) > 4 else ""
-            except (IndexError, TypeError):
-                marque = ""
-                
-            self.treeview_panier.insert("", tk.END, values=(
-                element[1],      # Description
-                element[0],      # ID
-                marque,         # Marque
-                quantity,       # Quantité
-                f"{price:.2f}€", # Prix
-                f"{total:.2f}€"  # Prix total
-            ))
-        
-        if self.panier:
-            total_sum = sum(float(self.treeview_panier.item(item)['values'][5].replace('€','').replace(',','.')) 
-                    for item in self.treeview_panier.get_children())
-            self.treeview_panier.insert("", tk.END, values=(
-                "TOTAL", "", "", "", "", f"{total_sum:.2f}€"
-            ), tags=('total',))
+        self.cart_items = {}
+        self.cart_line_totals = {}
+        self.cart_total_cents = 0
+        self.cart_total_item = None
+
+        lines = self.service.cart_snapshot()
+        # One query for all the versions not cached yet
+        self.products.resolve_many([line['version'] for line in lines.values()])
+        for id_produit, line in lines.items():
+            values, total = self.service.line_values(line)
+            self.cart_items[id_produit] = self.treeview_panier.insert("", tk.END, values=values)
+            self.cart_line_totals[id_produit] = total
+            self.cart_total_cents += total
+
+        self.update_cart_total()
+        metrics.observe("cart_display_seconds", time.perf_counter() - started, mode="full")
+
+    def refresh_cart_line(self, id_produit):
+        # Update only the row of one product plus the running total
+        started = time.perf_counter()
+        line = self.panier.get(id_produit)
+        item = self.cart_items.get(id_produit)
+        self.cart_total_cents -= self.cart_line_totals.pop(id_produit, 0)
+
+        if line is None:
+            if item is not None:
+                self.treeview_panier.delete(item)
+                del self.cart_items[id_produit]
+        else:
+            values, total = self.service.line_values(line)
+            if item is not None:
+                self.treeview_panier.item(item, values=values)
+            else:
+                self.cart_items[id_produit] = self.treeview_panier.insert("", tk.END, values=values)
+            self.cart_line_totals[id_produit] = total
+            self.cart_total_cents += total
+
+        self.update_cart_total()
+        metrics.observe("cart_display_seconds", time.perf_counter() - started, mode="line")
+
+    def update_cart_total(self):
+        if not self.cart_items:
+            if self.cart_total_item is not None:
+                self.treeview_panier.delete(self.cart_total_item)
+                self.cart_total_item = None
+            return
+
+        values = ("TOTAL", "", "", "", "", format_cents(self.cart_total_cents))
+        if self.cart_total_item is None:
+            self.cart_total_item = self.treeview_panier.insert("", tk.END, values=values, tags=('total',))
             self.treeview_panier.tag_configure('total', font=('TkDefaultFont', 9, 'bold'))
+        else:
+            self.treeview_panier.item(self.cart_total_item, values=values)
+            # Keep the total as the last row
+            self.treeview_panier.move(self.cart_total_item, "", tk.END)
 
-    def reset_cart(self):
-        self.panier = {}
-        self.save_cart()
-        self.socketio.emit('panier_update', self.panier, room=None)
-        self.update_cart_display()
+    def new_order(self):
+        # The current order stays open in the history
+        name = simpledialog.askstring("Nouvelle commande", "Nom de la commande :", parent=self.root)
+        if name is None:
+            return
+        self.switch_order(self.orders.create(name.strip()))
+
+    def show_orders(self):
+        OrdersWindow(self)
 
     def copy_cart(self):
         if not self.panier:
@@ -785,19 +1292,28 @@ class GestionCommandes:
             return
         
         content = ""
-        for details in self.panier.values():
-            element = details['element']
+        lines = self.service.cart_snapshot()
+        elements = self.products.resolve_many([details['version'] for details in lines.values()])
+        for details in lines.values():
+            element = elements[details['version']]
             quantity = details['quantite']
-            price = float(element[3].replace('€','').replace(',','.'))
-            content += f"{element[1]}\t{element[0]}\tU\t{quantity}\t{price:.2f}€\t{price*quantity:.2f}€\n"
+            price = element_price_cents(element)
+            content += f"{element[1]}\t{element[0]}\tU\t{quantity}\t{format_cents(price)}\t{format_cents(price * quantity)}\n"
         
+        import pyperclip
+
         pyperclip.copy(content)
         messagebox.showinfo(" ", "Contenu copié dans le presse-papiers")
 
     def show_qr_code(self):
         ip_address = socket.gethostbyname(socket.gethostname())
+        import qrcode
+        from PIL import ImageTk
+
         qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(f'http://{ip_address}:5000')
+        qr.add_data(
+            f'http://{ip_address}:{self.settings["server_port"]}/commande/{self.service.current_cart.order_id}'
+        )
         qr.make(fit=True)
         
         window = Toplevel(self.root)
@@ -809,36 +1325,48 @@ class GestionCommandes:
         label.image = img_tk
         label.pack(padx=20, pady=20)
 
+    def on_catalogue_changed(self):
+        # F1 was modified: drop cached results and refresh the result list
+        self.search_cache.invalidate()
+        self.service.catalogue.invalidate()
+        logging.debug(f"Search cache invalidated: {self.search_cache.stats()}")
+        self.search_scheduler.run_now(self.entry_valeur.get().strip().upper())
+
     def show_database_manager(self, event):
-        DatabaseManagerWindow(self, self.conn)
+        DatabaseManagerWindow(self, self.db)
+
+    def start_server(self):
+        with self.startup.phase("flask_setup"):
+            self.service.start_server()
 
     def run(self):
-        def run_flask():
-            self.socketio.run(
-                self.app,
-                host='0.0.0.0',
-                port=5000,
-                debug=False,
-                use_reloader=False,
-                allow_unsafe_werkzeug=True
-            )
-    
-        flask_thread = threading.Thread(target=run_flask, daemon=True)
-        flask_thread.start()
+        # Start the server once the main window is on screen
+        self.root.after(100, self.start_server)
     
         try:
             self.root.mainloop()
         finally:
             # Cleanup when application closes
-            self.conn.close()
+            self.service.close()
 
 if __name__ == '__main__':
+    # --headless: phone server only, for a machine without a display
+    headless = '--headless' in sys.argv[1:]
+    log_listener = setup_logging(load_settings())
     try:
-        app = GestionCommandes()
-        app.run()
+        if headless:
+            ServiceCommandes().serve_forever()
+        else:
+            app = GestionCommandes()
+            app.run()
     except Exception as e:
         logging.error(f"Error: {str(e)}")
         logging.error(traceback.format_exc())
         print(f"An error occurred: {str(e)}")
         print("See app.log for details")
+        if headless:
+            # Let the process supervisor see the failure
+            sys.exit(1)
         input("Press Enter to exit...")
+    finally:
+        log_listener.stop()
@@ -0,0 +1,2800 @@
+"""Catalogue, orders and phone server of Gestion de commandes, without the Tk window.
+
+GestionDeCommande.py builds the desktop window on top of ServiceCommandes;
+``python GestionDeCommande.py --headless`` runs the service alone.
+"""
+import sqlite3
+import threading
+import json
+import os
+import sys
+import logging
+import logging.handlers
+import traceback
+import re
+import unicodedata
+import csv
+import queue
+import time
+import gzip
+import hashlib
+import heapq
+from bisect import bisect_left
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import mimetypes
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+
+# Heavy or rarely used modules (flask, flask_socketio, openpyxl, pyarrow, numpy)
+# are imported where they are first needed to keep the start of the application fast.
+
+# Page size of /api/products when no limit is given, and the largest allowed
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 200
+# API responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 512
+# Stands for a NULL prix_cents in the /api/products cursors; SQLite sorts NULL first
+NULL_PRIX_CENTS = -(2 ** 63)
+# Largest quantity of a cart line, as limited by the quantity field of the page
+MAX_QUANTITE = 999
+
+# Used for the static files missing from the static folder
+STATIC_FALLBACK_URLS = {
+    'vendor/socket.io.min.js': 'https://cdn.socket.io/4.8.1/socket.io.min.js',
+}
+
+# Columns of a catalogue row as used by the search and the cart lines
+F1_COLUMNS = "id, description, type, prix, marque, prix_cents"
+
+# SQL expression converting a "12,50 €" price to integer cents, following the
+# steps of prix_to_cents in plain SQL so that any SQLite client can run the
+# triggers using it. Unlike prix_to_cents, letters are only removed around the
+# number: "12 € HT" reads 1200 in both, "12abc34" reads 0 here.
+PRIX_CENTS_SQL = """(
+    SELECT CASE WHEN digits GLOB '*[^0-9]*' OR fraction GLOB '*[^0-9]*' THEN 0
+        ELSE (1 - 2 * negative) * (CAST(digits AS INTEGER) * 100
+                                   + (CAST(substr(fraction || '000', 1, 3) AS INTEGER) + 5) / 10)
+    END
+    FROM (
+        SELECT negative,
+               replace(replace(CASE WHEN is_decimal THEN substr(head, 1, length(head) - 1) ELSE number END,
+                               ',', ''), '.', '') AS digits,
+               CASE WHEN is_decimal THEN substr(number, length(head) + 1) ELSE '' END AS fraction
+        FROM (
+            SELECT negative, number, head,
+                   substr(head, -1) IN (',', '.')
+                   AND length(number) - length(replace(number, substr(head, -1), '')) = 1 AS is_decimal
+            FROM (
+                SELECT negative, number, rtrim(number, '0123456789') AS head
+                FROM (
+                    SELECT text LIKE '-%' AS negative, substr(text, 1 + (text LIKE '-%')) AS number
+                    FROM (
+                        SELECT trim(replace(replace(replace(replace(replace(CAST({col} AS TEXT),
+                                    ' ', ''), char(160), ''), char(8239), ''), char(8201), ''), char(39), ''),
+                                    'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz€$£/:*()') AS text
+                    )
+                )
+            )
+        )
+    )
+)"""
+
+
+def prix_to_cents(prix):
+    """Convert a text price such as "1 234,50 €" to integer cents.
+
+    Currency symbols or codes and spaces are ignored. When both "," and "."
+    appear the last one is the decimal separator; a separator appearing
+    several times groups thousands, a single one is the decimal separator.
+    Half cents are rounded away from zero. Unreadable prices give 0.
+    """
+    if isinstance(prix, (int, float)) and not isinstance(prix, bool):
+        text = repr(prix)
+    else:
+        text = re.sub(r"[^0-9,.\-]", "", str(prix))
+    separators = [char for char in text if char in ",."]
+    if separators:
+        decimal = separators[-1]
+        if separators.count(decimal) > 1:
+            decimal = None
+        integer, _, fraction = text.rpartition(decimal) if decimal else (text, '', '')
+        text = integer.replace(",", "").replace(".", "") + "." + fraction
+    try:
+        return int(Decimal(text).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return 0
+
+
+DEFAULT_SETTINGS = {
+    # Delay after the last keystroke before the main search runs
+    "search_debounce_ms": 250,
+    # Number of keyword lists whose results are kept in memory
+    "search_cache_size": 32,
+    # Largest cached result set that is narrowed in memory rather than re-queried
+    "search_cache_narrow_max_rows": 20000,
+    # Idle SQLite connections kept open by the connection pool
+    "db_pool_size": 8,
+    # How long a writer waits for a lock before "database is locked"
+    "db_busy_timeout_ms": 5000,
+    # Cart changes within this window are written to disk together
+    "cart_flush_interval_ms": 500,
+    # Product versions kept in memory to price the order lines
+    "product_cache_size": 4096,
+    # Web server backend: "threading", "eventlet" or "gevent"
+    "server_mode": "threading",
+    "server_port": 5000,
+    # Connections served at once, the next ones wait to be accepted
+    "server_max_connections": 200,
+    # Idle time before a keep-alive HTTP connection is closed (eventlet)
+    "server_keepalive_s": 30,
+    # Time given to open connections to finish when the application closes
+    "server_shutdown_timeout_s": 5,
+    "socketio_ping_interval_s": 25,
+    "socketio_ping_timeout_s": 20,
+    # Typo-tolerant search, used when the regular search finds nothing
+    "fuzzy_search": True,
+    # Share of a keyword's trigrams a product must contain to be listed
+    "fuzzy_min_similarity": 0.5,
+    "fuzzy_max_results": 200,
+    # Answer the main window's searches from a columnar copy of the catalogue
+    # in memory (needs numpy), SQLite being used above this size
+    "catalogue_snapshot": True,
+    "catalogue_snapshot_max_mb": 256,
+    # Collect timings and counters and serve them on /metrics
+    "metrics_enabled": False,
+    "log_file": "app.log",
+    # DEBUG, INFO, WARNING or ERROR
+    "log_level": "INFO",
+    # "text" or "json" (one JSON object per line)
+    "log_format": "text",
+    # Rotate when the file reaches this size, or at the given time ("midnight",
+    # "h"...) when log_rotate_when is set; older files kept: log_backup_count
+    "log_max_bytes": 1000000,
+    "log_rotate_when": "",
+    "log_backup_count": 5,
+}
+
+
+def load_settings(path='settings.json'):
+    """Return DEFAULT_SETTINGS overridden by the optional settings.json file."""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(path, 'r') as f:
+            settings.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read {path}, using default settings: {e}")
+    return settings
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, for log analysis tools."""
+
+    def format(self, record):
+        # QueueHandler already appended any traceback to the message
+        return json.dumps({
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }, ensure_ascii=False)
+
+
+def setup_logging(settings):
+    """Send the log records to a background thread that writes the log file.
+
+    Logging calls only put the record on a queue, so Socket.IO handlers and
+    Werkzeug request logging never wait on the disk. Returns the
+    QueueListener, to stop() before exiting so the last records are written.
+    """
+    if settings["log_rotate_when"]:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            settings["log_file"],
+            when=settings["log_rotate_when"],
+            backupCount=settings["log_backup_count"],
+            encoding='utf-8'
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            settings["log_file"],
+            maxBytes=settings["log_max_bytes"],
+            backupCount=settings["log_backup_count"],
+            encoding='utf-8'
+        )
+    if settings["log_format"] == "json":
+        file_handler.setFormatter(JsonLogFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    level = logging.getLevelName(str(settings["log_level"]).upper())
+    root_logger.setLevel(level if isinstance(level, int) else logging.INFO)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    if not isinstance(level, int):
+        logging.warning(f"Unknown log level {settings['log_level']!r}, using INFO")
+    return listener
+
+
+def format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}€"
+
+
+def element_price_cents(element):
+    # Cart lines saved before the prix_cents column existed only carry the text price
+    if len(element) > 5 and element[5] is not None:
+        return int(element[5])
+    return prix_to_cents(element[3])
+
+
+def get_resource_path(relative_path):
+    """Path of a file shipped with the application, also once frozen."""
+    try:
+        if hasattr(sys, '_MEIPASS'): 
+            # PyInstaller path
+            base_path = sys._MEIPASS
+        elif getattr(sys, 'frozen', False):
+            # cx_Freeze path
+            base_path = os.path.dirname(sys.executable)
+        else:
+            # Development path
+            base_path = os.path.abspath(os.path.dirname(__file__))
+        return os.path.join(base_path, relative_path)
+    except Exception as e:
+        print(f"Error getting resource path: {e}")
+        return relative_path
+
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Metrics:
+    """Counters and latency summaries of the hot paths, exposed on /metrics.
+
+    Disabled by default: every call then returns at once and timer() hands
+    out a shared no-op context manager, so instrumented code pays for one
+    attribute check. Latency quantiles are computed over the last WINDOW
+    observations of each series. Callback metrics (connected clients,
+    cache hits...) are read only when /metrics is rendered.
+    """
+
+    PREFIX = "gestion_"
+    WINDOW = 1024
+    QUANTILES = (0.5, 0.9, 0.99)
+    HELP = {
+        "search_seconds": "Duration of the searches run by the main window",
+        "search_fuzzy_seconds": "Duration of the typo-tolerant searches",
+        "search_snapshot_seconds": "Duration of the searches answered by the catalogue snapshot",
+        "catalogue_snapshot_bytes": "Memory used by the catalogue snapshot",
+        "catalogue_snapshot_bytes_per_row": "Memory used by the catalogue snapshot per row",
+        "search_skipped_total": "Searches superseded by a newer one before being shown",
+        "search_cache_hits_total": "Searches answered from the search cache",
+        "search_cache_narrowed_total": "Searches answered by filtering a cached result",
+        "search_cache_misses_total": "Searches sent to SQLite",
+        "db_statements_total": "SQL statements run, including trigger statements",
+        "db_transaction_seconds": "Duration of the write transactions",
+        "db_rollbacks_total": "Write transactions rolled back",
+        "cart_write_seconds": "Duration of the order line writes",
+        "cart_writes_total": "Order line writes",
+        "cart_lines_written_total": "Order lines written or deleted",
+        "cart_display_seconds": "Duration of the cart table updates",
+        "socketio_event_seconds": "Duration of the Socket.IO event handlers",
+        "socketio_emits_total": "Socket.IO messages sent",
+        "socketio_emit_bytes_total": "JSON bytes of the Socket.IO messages sent",
+        "socketio_clients": "Connected Socket.IO clients",
+        "orders_loaded": "Orders held in memory",
+        "http_request_seconds": "Duration of the HTTP requests",
+        "catalogue_import_seconds": "Duration of the catalogue imports",
+        "catalogue_export_seconds": "Duration of the catalogue exports",
+        "catalogue_rows_imported_total": "Catalogue rows read by the imports",
+    }
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+        self._callbacks = {}
+        self._null_timer = nullcontext()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = [deque(maxlen=self.WINDOW), 0.0, 0]
+            summary[0].append(seconds)
+            summary[1] += seconds
+            summary[2] += 1
+
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return self._null_timer
+        return _Timer(self, name, labels)
+
+    def register(self, name, func, kind="gauge"):
+        """Metric read from func() when rendering; kind is "gauge" or "counter"."""
+        self._callbacks[name] = (func, kind)
+
+    def count_statement(self, sql):
+        # sqlite3 trace callback, installed on the connections only when enabled
+        words = sql.split(None, 1)
+        if not words:
+            kind = "other"
+        elif sql.startswith("--"):
+            # Statements run by triggers are reported as "-- TRIGGER name"
+            kind = "trigger"
+        else:
+            kind = words[0].lower()
+        self.inc("db_statements_total", kind=kind)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = []
+        for key, value in list(labels) + list(extra):
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{key}="{value}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: (sorted(window), total, count) for key, (window, total, count) in self._summaries.items()}
+
+        families = OrderedDict()
+        for (name, labels), value in sorted(counters.items()):
+            families.setdefault((name, "counter"), []).append(f"{self.PREFIX}{name}{self._labels(labels)} {value}")
+        for (name, labels), (window, total, count) in sorted(summaries.items()):
+            lines = families.setdefault((name, "summary"), [])
+            for quantile in self.QUANTILES:
+                value = window[min(len(window) - 1, int(quantile * len(window)))]
+                lines.append(f"{self.PREFIX}{name}{self._labels(labels, [('quantile', quantile)])} {value:.6f}")
+            lines.append(f"{self.PREFIX}{name}_sum{self._labels(labels)} {total:.6f}")
+            lines.append(f"{self.PREFIX}{name}_count{self._labels(labels)} {count}")
+        for name, (func, kind) in sorted(self._callbacks.items()):
+            try:
+                value = func()
+            except Exception as e:
+                logging.warning(f"Metric {name} unavailable: {e}")
+                continue
+            families.setdefault((name, kind), []).append(f"{self.PREFIX}{name} {value}")
+
+        output = []
+        for (name, kind), lines in families.items():
+            if name in self.HELP:
+                output.append(f"# HELP {self.PREFIX}{name} {self.HELP[name]}")
+            output.append(f"# TYPE {self.PREFIX}{name} {kind}")
+            output.extend(lines)
+        return "\n".join(output) + "\n"
+
+
+# Shared by every component; enabled by GestionCommandes from the settings
+metrics = Metrics()
+
+
+class Database:
+    """Pool of SQLite connections shared by the Tk, worker and Flask threads.
+
+    A thread borrows one connection at a time with connection() or
+    transaction(); nested calls on the same thread reuse it. Connections run
+    in autocommit mode so reads never hold a lock, and writes are grouped in
+    short BEGIN IMMEDIATE transactions. The database uses WAL journaling so
+    readers and the writer do not block each other, and pooled connections
+    keep their prepared statement cache between uses.
+    """
+
+    def __init__(self, path, pool_size=8, busy_timeout_ms=5000, cached_statements=256):
+        self.path = path
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._closed = False
+
+        with self.connection() as conn:
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if str(mode).lower() != 'wal':
+                logging.warning(f"Could not enable WAL journal mode, using {mode}")
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        if metrics.enabled:
+            conn.set_trace_callback(metrics.count_statement)
+        with self._lock:
+            self._connections.add(conn)
+        return conn
+
+    def acquire(self):
+        """Take a connection out of the pool; give it back with release()."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if not self._closed and self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            if conn.in_transaction:
+                # Join the enclosing transaction
+                yield conn
+                return
+
+            with metrics.timer("db_transaction_seconds"):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    metrics.inc("db_rollbacks_total")
+                    raise
+                conn.execute("COMMIT")
+
+    def close_all(self):
+        self._closed = True
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+class SearchIndex:
+    """Full-text index over the description, type and marque columns of F1.
+
+    F1_fts is an external-content FTS5 table kept in sync with F1 by triggers.
+    Keywords are matched as case- and accent-insensitive token prefixes, so
+    "rob 15" finds "ROBINET 15/21". When FTS5 is not available in the SQLite
+    library, queries fall back to the UPPER(col) LIKE '%kw%' filter.
+    """
+
+    def __init__(self, db):
+        self.fts_enabled = False
+        try:
+            with db.transaction() as conn:
+                self.setup(conn)
+            self.fts_enabled = True
+        except sqlite3.Error as e:
+            logging.warning(f"FTS5 unavailable, falling back to LIKE search: {e}")
+
+    def setup(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS F1_fts USING fts5(
+                description, type, marque,
+                content='F1', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS F1_fts_ai AFTER INSERT ON F1 BEGIN
+                INSERT INTO F1_fts(rowid, description, type, marque)
+                VALUES (new.id, new.description, new.type, new.marque);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS F1_fts_ad AFTER DELETE ON F1 BEGIN
+                INSERT INTO F1_fts(F1_fts, rowid, description, type, marque)
+                VALUES ('delete', old.id, old.description, old.type, old.marque);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS F1_fts_au AFTER UPDATE OF id, description, type, marque ON F1 BEGIN
+                INSERT INTO F1_fts(F1_fts, rowid, description, type, marque)
+                VALUES ('delete', old.id, old.description, old.type, old.marque);
+                INSERT INTO F1_fts(rowid, description, type, marque)
+                VALUES (new.id, new.description, new.type, new.marque);
+            END
+        """)
+
+        # Rebuild when the index is new or out of step with F1 (e.g. rows
+        # written before the triggers existed)
+        cursor.execute("SELECT COUNT(*) FROM F1_fts_docsize")
+        indexed = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM F1")
+        if cursor.fetchone()[0] != indexed:
+            logging.info("Rebuilding F1_fts search index")
+            cursor.execute("INSERT INTO F1_fts(F1_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def has_token(keyword):
+        # Keywords made only of punctuation produce an empty FTS phrase
+        return any(ch.isalnum() for ch in keyword)
+
+    @staticmethod
+    def tokenize(text):
+        """Split text into lowercase, accent-free tokens like the unicode61 tokenizer."""
+        text = str(text or '')
+        # Most catalogue text is plain ASCII: nothing to strip
+        if not text.isascii():
+            text = unicodedata.normalize('NFKD', text)
+            text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+        return re.findall(r'[^\W_]+', text.lower())
+
+    def row_tokens(self, row):
+        return [self.tokenize(row[1]), self.tokenize(row[2]), self.tokenize(row[4])]
+
+    def keyword_matches(self, keyword, row, row_tokens):
+        """Python equivalent of the SQL filter for a single keyword."""
+        if not (self.fts_enabled and self.has_token(keyword)):
+            return any(keyword in str(value or '').upper() for value in (row[1], row[2], row[4]))
+
+        # Same semantics as the FTS phrase query: all tokens but the last must
+        # match exactly and consecutively, the last one as a prefix
+        keyword_tokens = self.tokenize(keyword)
+        head, last = keyword_tokens[:-1], keyword_tokens[-1]
+        for tokens in row_tokens:
+            for i in range(len(tokens) - len(head)):
+                if tokens[i:i + len(head)] == head and tokens[i + len(head)].startswith(last):
+                    return True
+        return False
+
+    def keyword_covers(self, old_keyword, new_keyword):
+        """True when every row matching new_keyword also matches old_keyword."""
+        if old_keyword == new_keyword:
+            return True
+        if self.fts_enabled and not self.has_token(old_keyword):
+            return False
+        return new_keyword.startswith(old_keyword)
+
+    def build_where(self, search_text, use_fts=None):
+        """Return the WHERE condition and parameters for a search, "" for no filter."""
+        if use_fts is None:
+            use_fts = self.fts_enabled
+
+        keywords = search_text.split()
+        conditions = []
+        params = []
+
+        fts_keywords = [kw for kw in keywords if use_fts and self.has_token(kw)]
+        if fts_keywords:
+            match = " AND ".join('"' + kw.replace('"', '""') + '"*' for kw in fts_keywords)
+            conditions.append("id IN (SELECT rowid FROM F1_fts WHERE F1_fts MATCH ?)")
+            params.append(match)
+
+        for keyword in keywords:
+            if keyword in fts_keywords:
+                continue
+            conditions.append("(UPPER(description) LIKE ? OR UPPER(type) LIKE ? OR UPPER(marque) LIKE ?)")
+            params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
+
+        return ' AND '.join(conditions), params
+
+    def build_query(self, search_text, order_by=None, use_fts=None):
+        where, params = self.build_where(search_text, use_fts)
+        where_clause = f" WHERE {where}" if where else ""
+        order_clause = f" ORDER BY {order_by}" if order_by else ""
+        return f"SELECT {F1_COLUMNS} FROM F1{where_clause}{order_clause}", params
+
+    def _execute(self, cursor, make_query):
+        # make_query(use_fts) returns (query, params)
+        try:
+            cursor.execute(*make_query(self.fts_enabled))
+        except sqlite3.OperationalError as e:
+            if not self.fts_enabled or "interrupted" in str(e):
+                raise
+            logging.warning(f"FTS query failed, falling back to LIKE search: {e}")
+            cursor.execute(*make_query(False))
+        return cursor.fetchall()
+
+    def search(self, cursor, search_text, order_by=None):
+        return self._execute(cursor, lambda use_fts: self.build_query(search_text, order_by, use_fts))
+
+    def search_page(self, cursor, search_text, limit, after=None):
+        """Return up to limit matching rows ordered by price then id.
+
+        after is the (prix_cents, id) key of the last row of the previous page,
+        so each page is an index range scan whatever its position. Rows whose
+        prix_cents is NULL come first, as in ORDER BY.
+        """
+        def make_query(use_fts):
+            where, params = self.build_where(search_text, use_fts)
+            conditions = [where] if where else []
+            if after is not None and after[0] is None:
+                conditions.append("((prix_cents IS NULL AND id > ?) OR prix_cents IS NOT NULL)")
+                params = params + [after[1]]
+            elif after is not None:
+                conditions.append("(prix_cents, id) > (?, ?)")
+                params = params + list(after)
+            where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            return (
+                f"SELECT {F1_COLUMNS} FROM F1{where_clause} ORDER BY prix_cents, id LIMIT ?",
+                params + [limit]
+            )
+        return self._execute(cursor, make_query)
+
+
+class SearchCache:
+    """Bounded LRU cache of search results keyed by the normalized keyword list.
+
+    When a new keyword list refines a cached one (every cached keyword is
+    covered by a new keyword, e.g. "robinet" -> "robinet laiton"), the cached
+    rows are filtered in memory instead of querying SQLite again. The cache
+    must be invalidated whenever F1 changes.
+    """
+
+    def __init__(self, search_index, max_entries=32, narrow_max_rows=20000):
+        self.search_index = search_index
+        self.max_entries = max_entries
+        self.narrow_max_rows = narrow_max_rows
+        self.hits = 0
+        self.narrowed = 0
+        self.misses = 0
+        self._version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(search_text):
+        return tuple(sorted(set(search_text.upper().split())))
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'narrowed': self.narrowed,
+            'misses': self.misses,
+        }
+
+    def search(self, cursor, search_text, order_by=None):
+        keywords = self.normalize(search_text)
+        key = (order_by, keywords)
+
+        with self._lock:
+            version = self._version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            base = self._find_refinable(order_by, keywords)
+
+        if base is not None:
+            rows, tokens = base
+            if tokens is None:
+                tokens = [self.search_index.row_tokens(row) for row in rows]
+            kept = [
+                (row, row_tokens) for row, row_tokens in zip(rows, tokens)
+                if all(self.search_index.keyword_matches(kw, row, row_tokens) for kw in keywords)
+            ]
+            rows = [row for row, _ in kept]
+            tokens = [row_tokens for _, row_tokens in kept]
+            with self._lock:
+                self.narrowed += 1
+        else:
+            rows = self.search_index.search(cursor, " ".join(keywords), order_by=order_by)
+            tokens = None
+            with self._lock:
+                self.misses += 1
+
+        with self._lock:
+            # Do not store results computed from a catalogue that changed meanwhile
+            if version == self._version:
+                self._entries[key] = (rows, tokens)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return rows
+
+    def _find_refinable(self, order_by, keywords):
+        best = None
+        for (entry_order, entry_keywords), entry in self._entries.items():
+            if entry_order != order_by or len(entry[0]) > self.narrow_max_rows:
+                continue
+            if not all(any(self.search_index.keyword_covers(old, new) for new in keywords)
+                       for old in entry_keywords):
+                continue
+            if best is None or len(entry[0]) < len(best[0]):
+                best = entry
+        return best
+
+
+class FuzzyIndex:
+    """Typo-tolerant search over the description, type and marque of F1.
+
+    Each token is cut into padded trigrams ("robinet" -> "  r", " ro", "rob",
+    ..., "et ") and every trigram lists the rows containing it. A keyword
+    scores, for each row, the share of its trigrams found in the row, so
+    "robinnet" still finds "ROBINET" (7 trigrams of 9); a row's score is the
+    mean over the keywords. Rows scoring at least min_similarity are ranked
+    by score, then shortest first. The counting runs in bulk with numpy
+    (bincount over the posting lists) when it is installed, in Python
+    otherwise.
+
+    The index lives in memory. It is built once, then before each search
+    brought up to date from F1_history with the products inserted or changed
+    since. Deleted products stay in it until the next rebuild but are
+    dropped when the rows are read back from F1.
+    """
+
+    # Changed products leave a dead entry behind: rebuild past this share
+    MAX_DEAD_RATIO = 0.25
+    # Stay below the SQLite host parameter limit
+    CHUNK_SIZE = 500
+
+    def __init__(self, db, min_similarity=0.5, limit=200):
+        self.db = db
+        self.min_similarity = min_similarity
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._np = None
+        self._built = False
+        self._clear()
+
+    def _clear(self):
+        # Entries by position: product id, trigram count, still current
+        self._ids = array('q')
+        self._sizes = array('i')
+        self._alive = bytearray()
+        self._positions = {}
+        self._postings = {}
+        self._version = 0
+        self._dead = 0
+
+    @staticmethod
+    def trigrams(text):
+        found = set()
+        for token in SearchIndex.tokenize(text):
+            padded = f"  {token} "
+            found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return found
+
+    def start_build(self):
+        """Build the index on a background thread so the first search does not wait."""
+        def build():
+            try:
+                self.build()
+            except Exception as e:
+                logging.error(f"Fuzzy index build failed: {e}")
+        threading.Thread(target=build, name="fuzzy-index", daemon=True).start()
+
+    def build(self):
+        """Build the whole index again from F1."""
+        with self.db.connection() as conn, self._lock:
+            self._built = False
+            self._update(conn.cursor())
+
+    def stats(self):
+        return {'rows': len(self._alive) - self._dead, 'numpy': bool(self._np)}
+
+    def _update(self, cursor):
+        cursor.execute("SELECT MAX(version) FROM F1_history")
+        version = cursor.fetchone()[0] or 0
+        if not self._built:
+            self._rebuild(cursor, version)
+        elif version != self._version:
+            self._refresh(cursor, version)
+
+    def _rebuild(self, cursor, version):
+        if self._np is None:
+            try:
+                import numpy
+                self._np = numpy
+            except ImportError:
+                self._np = False
+        started = time.perf_counter()
+        self._built = False
+        self._clear()
+        cursor.execute("SELECT id, description, type, marque FROM F1")
+        for row in cursor:
+            self._add(row)
+        self._version = version
+        self._built = True
+        logging.info(
+            f"Fuzzy index built: {len(self._ids)} rows, {len(self._postings)} trigrams "
+            f"in {time.perf_counter() - started:.2f}s ({'numpy' if self._np else 'python'} scoring)"
+        )
+
+    def _refresh(self, cursor, version):
+        cursor.execute("SELECT DISTINCT product_id FROM F1_history WHERE version > ?", (self._version,))
+        changed = [row[0] for row in cursor.fetchall()]
+        if len(changed) > len(self._positions) // 2:
+            # Mostly a new catalogue (first import)
+            self._rebuild(cursor, version)
+            return
+
+        for product_id in changed:
+            position = self._positions.pop(product_id, None)
+            if position is not None:
+                self._alive[position] = 0
+                self._dead += 1
+        for start in range(0, len(changed), self.CHUNK_SIZE):
+            chunk = changed[start:start + self.CHUNK_SIZE]
+            cursor.execute(
+                f"SELECT id, description, type, marque FROM F1 WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                self._add(row)
+        self._version = version
+
+        if self._dead > self.MAX_DEAD_RATIO * len(self._ids):
+            self._rebuild(cursor, version)
+
+    def _add(self, row):
+        position = len(self._ids)
+        trigrams = self.trigrams(f"{row[1] or ''} {row[2] or ''} {row[3] or ''}")
+        self._ids.append(row[0])
+        self._sizes.append(len(trigrams))
+        self._alive.append(1)
+        self._positions[row[0]] = position
+        for trigram in trigrams:
+            postings = self._postings.get(trigram)
+            if postings is None:
+                postings = self._postings[trigram] = array('i')
+            postings.append(position)
+
+    def _rank_numpy(self, keyword_trigrams, limit):
+        np = self._np
+        count = len(self._ids)
+        totals = np.zeros(count)
+        for trigrams in keyword_trigrams:
+            postings = [
+                np.frombuffer(self._postings[trigram], dtype=np.intc)
+                for trigram in trigrams if trigram in self._postings
+            ]
+            if postings:
+                totals += np.bincount(np.concatenate(postings), minlength=count) * (1.0 / len(trigrams))
+        totals *= np.frombuffer(self._alive, dtype=np.uint8)
+
+        candidates = np.flatnonzero(totals >= self.min_similarity * len(keyword_trigrams))
+        ranks = -totals[candidates]
+        if len(candidates) > limit:
+            # Only sort the rows scoring at least the limit-th best score
+            kept = ranks <= np.partition(ranks, limit - 1)[limit - 1]
+            candidates, ranks = candidates[kept], ranks[kept]
+        sizes = np.frombuffer(self._sizes, dtype=np.intc)[candidates]
+        # Stable, so equal rows stay in position order like in _rank_python
+        order = np.lexsort((sizes, ranks))[:limit]
+        return candidates[order].tolist()
+
+    def _rank_python(self, keyword_trigrams, limit):
+        totals = {}
+        for trigrams in keyword_trigrams:
+            hits = {}
+            for trigram in trigrams:
+                for position in self._postings.get(trigram, ()):
+                    hits[position] = hits.get(position, 0) + 1
+            weight = 1.0 / len(trigrams)
+            for position, found in hits.items():
+                totals[position] = totals.get(position, 0.0) + found * weight
+        threshold = self.min_similarity * len(keyword_trigrams)
+        best = heapq.nsmallest(limit, (
+            (-total, self._sizes[position], position)
+            for position, total in totals.items()
+            if total >= threshold and self._alive[position]
+        ))
+        return [position for _, _, position in best]
+
+    def search(self, cursor, search_text, limit=None):
+        """The F1 rows closest to search_text, best first."""
+        keyword_trigrams = [self.trigrams(keyword) for keyword in search_text.split()]
+        keyword_trigrams = [trigrams for trigrams in keyword_trigrams if trigrams]
+        if not keyword_trigrams:
+            return []
+
+        with metrics.timer("search_fuzzy_seconds"):
+            with self._lock:
+                self._update(cursor)
+                if self._np:
+                    positions = self._rank_numpy(keyword_trigrams, limit or self.limit)
+                else:
+                    positions = self._rank_python(keyword_trigrams, limit or self.limit)
+                ids = [self._ids[position] for position in positions]
+
+            rows = {}
+            for start in range(0, len(ids), self.CHUNK_SIZE):
+                chunk = ids[start:start + self.CHUNK_SIZE]
+                cursor.execute(
+                    f"SELECT {F1_COLUMNS} FROM F1 WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+                rows.update((row[0], row) for row in cursor.fetchall())
+        return [rows[product_id] for product_id in ids if product_id in rows]
+
+
+class SnapshotRowSource:
+    """Row source over positions of a CatalogueSnapshot state, rows built on demand."""
+
+    def __init__(self, state, positions):
+        self.state = state
+        self.positions = positions
+
+    def count(self):
+        return len(self.positions)
+
+    def fetch(self, offset, limit):
+        return [self.state.row(position) for position in self.positions[offset:offset + limit].tolist()]
+
+
+class _SnapshotState:
+    """Column arrays of one version of the catalogue snapshot, never modified once built."""
+
+    # prix_cents of the rows whose price is NULL, sorted first like in SQLite
+    NULL_CENTS = NULL_PRIX_CENTS
+    # Bits of the nulls column
+    NULL_DESCRIPTION = 1
+    NULL_PRIX = 2
+
+    def __init__(self, np):
+        self.np = np
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.prix_cents = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        # Distinct type and marque values, the rows keep their index
+        self.labels = []
+        self.type_codes = np.zeros(0, dtype=np.int32)
+        self.marque_codes = np.zeros(0, dtype=np.int32)
+        # UTF-8 texts, row i is text[ends[i - 1]:ends[i]]
+        self.descriptions = b""
+        self.description_ends = np.zeros(0, dtype=np.int64)
+        self.prix = b""
+        self.prix_ends = np.zeros(0, dtype=np.int64)
+        self.nulls = np.zeros(0, dtype=np.uint8)
+        # Search tokens of every row as vocabulary ids, each column followed by -1
+        self.vocabulary = []
+        self.tokens = np.zeros(0, dtype=np.int32)
+        self.token_starts = np.zeros(0, dtype=np.int64)
+        # Rows of each token id: posting_rows[posting_starts[i]:posting_starts[i + 1]]
+        self.posting_rows = np.zeros(0, dtype=np.int32)
+        self.posting_starts = np.zeros(1, dtype=np.int64)
+        # Positions in (prix_cents, id) order
+        self.order = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _slice(blob, ends, position):
+        start = int(ends[position - 1]) if position else 0
+        return blob[start:int(ends[position])].decode('utf-8')
+
+    def row(self, position):
+        cents = int(self.prix_cents[position])
+        nulls = self.nulls[position]
+        return (
+            int(self.ids[position]),
+            None if nulls & self.NULL_DESCRIPTION else self._slice(self.descriptions, self.description_ends, position),
+            self.labels[self.type_codes[position]],
+            None if nulls & self.NULL_PRIX else self._slice(self.prix, self.prix_ends, position),
+            self.labels[self.marque_codes[position]],
+            None if cents == self.NULL_CENTS else cents
+        )
+
+    def nbytes(self):
+        arrays = (self.ids, self.prix_cents, self.alive, self.type_codes, self.marque_codes,
+                  self.description_ends, self.prix_ends, self.nulls, self.tokens, self.token_starts,
+                  self.posting_rows, self.posting_starts, self.order)
+        strings = sum(sys.getsizeof(text) for text in self.vocabulary) + sum(map(sys.getsizeof, self.labels))
+        return (sum(array.nbytes for array in arrays) + len(self.descriptions) + len(self.prix)
+                + strings + 8 * (len(self.vocabulary) + len(self.labels)))
+
+    def extend(self, rows, removed_ids=()):
+        """New state with removed_ids dropped and rows (F1_COLUMNS tuples) added."""
+        np = self.np
+        state = _SnapshotState(np)
+        state.alive = self.alive.copy()
+        if len(removed_ids):
+            state.alive &= ~np.isin(self.ids, np.asarray(removed_ids, dtype=np.int64))
+
+        row_tokens = [
+            [SearchIndex.tokenize(row[1]), SearchIndex.tokenize(row[2]), SearchIndex.tokenize(row[4])]
+            for row in rows
+        ]
+        new_words = {token for columns in row_tokens for tokens in columns for token in tokens}
+        state.vocabulary = self.vocabulary
+        old_tokens = self.tokens
+        if not new_words.issubset(self.vocabulary):
+            state.vocabulary = sorted(new_words.union(self.vocabulary))
+        token_ids = {token: i for i, token in enumerate(state.vocabulary)} if rows else {}
+        if state.vocabulary is not self.vocabulary and self.vocabulary:
+            # Ids follow the sorted vocabulary: renumber the existing tokens
+            renumber = np.fromiter((token_ids[token] for token in self.vocabulary), dtype=np.int32)
+            old_tokens = np.where(old_tokens >= 0, renumber[np.maximum(old_tokens, 0)], -1).astype(np.int32)
+
+        label_codes = {label: i for i, label in enumerate(self.labels)}
+        state.labels = list(self.labels)
+
+        def code(label):
+            if label not in label_codes:
+                label_codes[label] = len(state.labels)
+                state.labels.append(label)
+            return label_codes[label]
+
+        tokens, token_counts = [], []
+        for columns in row_tokens:
+            count = len(tokens)
+            for column in columns:
+                tokens.extend(token_ids[token] for token in column)
+                tokens.append(-1)
+            token_counts.append(len(tokens) - count)
+        descriptions = [(row[1] or '').encode('utf-8') for row in rows]
+        prix = [(row[3] or '').encode('utf-8') for row in rows]
+
+        def ends(previous, texts):
+            lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+            start = previous[-1] if len(previous) else 0
+            return np.concatenate([previous, start + np.cumsum(lengths)])
+
+        state.ids = np.concatenate([self.ids, np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))])
+        state.prix_cents = np.concatenate([self.prix_cents, np.fromiter(
+            (self.NULL_CENTS if row[5] is None else row[5] for row in rows), dtype=np.int64, count=len(rows)
+        )])
+        state.alive = np.concatenate([state.alive, np.ones(len(rows), dtype=bool)])
+        state.type_codes = np.concatenate([self.type_codes, np.array([code(row[2]) for row in rows], dtype=np.int32)])
+        state.marque_codes = np.concatenate([self.marque_codes, np.array([code(row[4]) for row in rows], dtype=np.int32)])
+        state.descriptions = self.descriptions + b"".join(descriptions)
+        state.description_ends = ends(self.description_ends, descriptions)
+        state.prix = self.prix + b"".join(prix)
+        state.prix_ends = ends(self.prix_ends, prix)
+        state.nulls = np.concatenate([self.nulls, np.array([
+            (row[1] is None) * self.NULL_DESCRIPTION | (row[3] is None) * self.NULL_PRIX for row in rows
+        ], dtype=np.uint8)])
+        state.token_starts = np.concatenate([
+            self.token_starts,
+            len(old_tokens) + np.concatenate([[0], np.cumsum(token_counts[:-1], dtype=np.int64)]).astype(np.int64)
+            if rows else np.zeros(0, dtype=np.int64)
+        ])
+        state.tokens = np.concatenate([old_tokens, np.array(tokens, dtype=np.int32)])
+        state.order = np.lexsort((state.ids, state.prix_cents))
+
+        # Inverted index: the ids of a prefix are contiguous, so are their rows
+        token_rows = np.repeat(
+            np.arange(len(state.ids), dtype=np.int32),
+            np.diff(np.append(state.token_starts, len(state.tokens)))
+        )
+        words = state.tokens >= 0
+        by_token = np.argsort(state.tokens[words], kind='stable')
+        state.posting_rows = token_rows[words][by_token]
+        state.posting_starts = np.searchsorted(
+            state.tokens[words][by_token], np.arange(len(state.vocabulary) + 1)
+        ).astype(np.int64)
+        return state
+
+    def match(self, keyword_tokens):
+        """Mask of the rows containing the tokens consecutively in one column, the last as a prefix."""
+        np = self.np
+        mask = np.zeros(len(self.ids), dtype=bool)
+        *head, last = keyword_tokens
+        low = bisect_left(self.vocabulary, last)
+        high = bisect_left(self.vocabulary, last + '\U0010ffff')
+        head_ids = []
+        for token in head:
+            i = bisect_left(self.vocabulary, token)
+            if i == len(self.vocabulary) or self.vocabulary[i] != token:
+                return mask
+            head_ids.append(i)
+        if low == high:
+            return mask
+        if not head:
+            mask[self.posting_rows[self.posting_starts[low]:self.posting_starts[high]]] = True
+            return mask
+
+        width = len(self.tokens) - len(head)
+        if width <= 0:
+            return mask
+        last_tokens = self.tokens[len(head):]
+        hits = (last_tokens >= low) & (last_tokens < high)
+        for offset, token_id in enumerate(head_ids):
+            hits &= self.tokens[offset:offset + width] == token_id
+        rows = np.searchsorted(self.token_starts, np.flatnonzero(hits), side='right') - 1
+        mask[rows] = True
+        return mask
+
+
+class CatalogueSnapshot:
+    """Columnar copy of F1 in memory answering the main window's searches.
+
+    Needs numpy. Each row is kept as columns (see _SnapshotState): ids,
+    prix_cents, codes of the type and marque, the description and prix texts
+    in UTF-8 blobs, and the search tokens as ids in one flat array. Token ids
+    follow the sorted vocabulary, so the tokens starting with a prefix form
+    an id range and a keyword is a few vectorized comparisons over the flat
+    array, with the same semantics as the FTS phrase query of SearchIndex.
+    Matches come out in (prix_cents, id) order through a precomputed
+    permutation, without sorting.
+
+    Like FuzzyIndex it follows F1_history before each search; invalidate(),
+    called after the application's own writes, also looks for deleted rows.
+    search() returns None whenever it cannot answer (numpy missing, build in
+    progress, snapshot over max_bytes, keyword without letters or digits,
+    FTS unavailable) and the caller queries SQLite instead.
+    """
+
+    # Changed or deleted rows stay as dead entries: rebuild past this share
+    MAX_DEAD_RATIO = 0.25
+    CHUNK_SIZE = 500
+    # Measured size of a row, used to give up before building an oversized snapshot
+    BYTES_PER_ROW_ESTIMATE = 235
+
+    def __init__(self, db, search_index, max_bytes=256 * 1024 * 1024, enabled=True):
+        self.db = db
+        self.search_index = search_index
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._np = None
+        self._state = None
+        self._version = 0
+        self._check_deleted = False
+        self.build_seconds = 0.0
+
+    def start_build(self):
+        """Build the snapshot on a background thread; SQLite answers meanwhile."""
+        def build():
+            try:
+                with self.db.connection() as conn, self._lock:
+                    self._update(conn.cursor())
+            except Exception as e:
+                logging.error(f"Catalogue snapshot build failed: {e}")
+        threading.Thread(target=build, name="catalogue-snapshot", daemon=True).start()
+
+    def invalidate(self):
+        # Rows may have been deleted, which F1_history does not record
+        self._check_deleted = True
+
+    def stats(self):
+        state = self._state
+        if state is None:
+            return {'rows': 0, 'bytes': 0, 'bytes_per_row': 0}
+        rows = int(state.alive.sum())
+        size = state.nbytes()
+        return {'rows': rows, 'bytes': size, 'bytes_per_row': round(size / rows, 1) if rows else 0}
+
+    def _update(self, cursor):
+        if not self.enabled:
+            return
+        if self._np is None:
+            try:
+                import numpy
+                self._np = numpy
+            except ImportError:
+                logging.info("numpy is not installed, searches go through SQLite")
+                self.enabled = False
+                return
+
+        cursor.execute("SELECT MAX(version) FROM F1_history")
+        version = cursor.fetchone()[0] or 0
+        if self._state is None:
+            self._rebuild(cursor, version)
+            return
+        if version != self._version:
+            cursor.execute("SELECT DISTINCT product_id FROM F1_history WHERE version > ?", (self._version,))
+            changed = [row[0] for row in cursor.fetchall()]
+            if len(changed) > len(self._state.ids) // 2:
+                self._rebuild(cursor, version)
+                return
+            rows = []
+            for start in range(0, len(changed), self.CHUNK_SIZE):
+                chunk = changed[start:start + self.CHUNK_SIZE]
+                cursor.execute(
+                    f"SELECT {F1_COLUMNS} FROM F1 WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+                rows.extend(cursor.fetchall())
+            self._state = self._state.extend(rows, changed)
+            self._version = version
+        if self._check_deleted:
+            self._check_deleted = False
+            state = self._state
+            cursor.execute("SELECT COUNT(*) FROM F1")
+            if cursor.fetchone()[0] != int(state.alive.sum()):
+                cursor.execute("SELECT id FROM F1")
+                present = self._np.fromiter((row[0] for row in cursor), dtype=self._np.int64)
+                deleted = state.ids[state.alive & ~self._np.isin(state.ids, present)]
+                self._state = state.extend([], deleted)
+        if (~self._state.alive).sum() > self.MAX_DEAD_RATIO * len(self._state.ids):
+            self._rebuild(cursor, version)
+
+    def _rebuild(self, cursor, version):
+        cursor.execute("SELECT COUNT(*) FROM F1")
+        estimate = cursor.fetchone()[0] * self.BYTES_PER_ROW_ESTIMATE
+        if estimate > self.max_bytes:
+            self._disable_over_limit(estimate)
+            return
+        started = time.perf_counter()
+        cursor.execute(f"SELECT {F1_COLUMNS} FROM F1")
+        state = _SnapshotState(self._np).extend(cursor.fetchall())
+        self.build_seconds = time.perf_counter() - started
+        size = state.nbytes()
+        if size > self.max_bytes:
+            self._disable_over_limit(size)
+            return
+        self._state = state
+        self._version = version
+        self._check_deleted = False
+        stats = self.stats()
+        logging.info(
+            f"Catalogue snapshot built: {stats['rows']} rows, {size / 1024 / 1024:.1f} MB "
+            f"({stats['bytes_per_row']} bytes per row) in {self.build_seconds:.2f}s"
+        )
+
+    def _disable_over_limit(self, size):
+        logging.warning(
+            f"Catalogue snapshot needs {size // 1024 // 1024} MB, over the "
+            f"{self.max_bytes // 1024 // 1024} MB limit: searches go through SQLite"
+        )
+        self.enabled = False
+        self._state = None
+
+    def search(self, cursor, search_text):
+        """Rows matching search_text in (prix_cents, id) order, or None to use SQLite."""
+        keywords = search_text.split()
+        if not (self.enabled and self.search_index.fts_enabled):
+            return None
+        if not all(SearchIndex.has_token(keyword) for keyword in keywords):
+            # Punctuation-only keywords use the LIKE filter
+            return None
+        # Never wait for a build running on another thread
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            with metrics.timer("search_snapshot_seconds"):
+                self._update(cursor)
+                state = self._state
+                if state is None:
+                    return None
+                mask = state.alive.copy()
+                for keyword in keywords:
+                    mask &= state.match(SearchIndex.tokenize(keyword))
+                return SnapshotRowSource(state, state.order[mask[state.order]])
+        finally:
+            self._lock.release()
+
+
+class CatalogueImporter:
+    """Imports a supplier price list (.xlsx or .csv) into F1 atomically.
+
+    Rows are streamed from the file (openpyxl read-only mode or csv) and
+    loaded with executemany into a temporary staging table. The staging table
+    is then applied to F1 as a diff (insert new ids, update changed rows and
+    optionally delete ids missing from the file) inside the same transaction,
+    so a bad row leaves F1 untouched. Staging only writes to the connection's
+    temporary database, so the write lock on F1 is held just for the diff.
+    """
+
+    COLUMNS = ('id', 'description', 'type', 'prix', 'marque')
+    BATCH_SIZE = 1000
+
+    def __init__(self, db, delete_missing=False, progress=None):
+        self.db = db
+        self.delete_missing = delete_missing
+        self.progress = progress or (lambda done, total=None, message=None: None)
+
+    def _column_indexes(self, header):
+        names = [str(name or '').strip().lower() for name in header]
+        indexes = []
+        for column in self.COLUMNS:
+            if column not in names:
+                raise ValueError(f"Colonne manquante dans le fichier : {column.capitalize()}")
+            indexes.append(names.index(column))
+        return indexes
+
+    def _convert(self, values, indexes, line):
+        row = [values[i] if i < len(values) else None for i in indexes]
+        if row[0] is None or str(row[0]).strip() == '':
+            return None
+        try:
+            try:
+                item_id = int(row[0])
+            except ValueError:
+                item_id = int(float(str(row[0]).replace(',', '.')))
+        except ValueError:
+            raise ValueError(f"Ligne {line} : ID invalide ({row[0]})")
+        return (item_id, *('' if value is None else str(value) for value in row[1:]))
+
+    def iter_rows(self, file_path):
+        """Yield (total_rows, row) pairs; total_rows is None when unknown."""
+        if file_path.lower().endswith('.csv'):
+            with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+                total = max(sum(1 for _ in f) - 1, 0)
+                f.seek(0)
+                sample = f.read(4096)
+                f.seek(0)
+                try:
+                    dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+                except csv.Error:
+                    dialect = csv.excel
+                reader = csv.reader(f, dialect)
+                indexes = self._column_indexes(next(reader, []))
+                for line, values in enumerate(reader, start=2):
+                    row = self._convert(values, indexes, line)
+                    if row is not None:
+                        yield total, row
+        else:
+            import openpyxl
+
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                sheet = workbook.active
+                total = sheet.max_row - 1 if sheet.max_row else None
+                rows = sheet.iter_rows(values_only=True)
+                indexes = self._column_indexes(next(rows, ()))
+                for line, values in enumerate(rows, start=2):
+                    row = self._convert(values, indexes, line)
+                    if row is not None:
+                        yield total, row
+            finally:
+                workbook.close()
+
+    def run(self, file_path):
+        started = time.perf_counter()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS F1_import (
+                    id INTEGER PRIMARY KEY,
+                    description TEXT,
+                    type TEXT,
+                    prix TEXT,
+                    marque TEXT
+                )
+            """)
+            cursor.execute("DELETE FROM temp.F1_import")
+            try:
+                # Stage the file in batches
+                loaded = 0
+                batch = []
+                self.progress(0, None, "Lecture du fichier...")
+                for total, row in self.iter_rows(file_path):
+                    batch.append(row)
+                    if len(batch) >= self.BATCH_SIZE:
+                        cursor.executemany("INSERT OR REPLACE INTO F1_import VALUES (?, ?, ?, ?, ?)", batch)
+                        loaded += len(batch)
+                        batch = []
+                        self.progress(loaded, total, f"Lecture du fichier... {loaded} lignes")
+                if batch:
+                    cursor.executemany("INSERT OR REPLACE INTO F1_import VALUES (?, ?, ?, ?, ?)", batch)
+                    loaded += len(batch)
+
+                self.progress(loaded, loaded, "Application des modifications...")
+                with self.db.transaction():
+                    summary = self._apply(cursor)
+                summary['total'] = loaded
+            finally:
+                cursor.execute("DROP TABLE IF EXISTS temp.F1_import")
+        logging.info(f"Catalogue import from {file_path}: {summary}")
+        file_format = os.path.splitext(file_path)[1].lower().lstrip('.')
+        metrics.observe("catalogue_import_seconds", time.perf_counter() - started, format=file_format)
+        metrics.inc("catalogue_rows_imported_total", loaded)
+        return summary
+
+    def _apply(self, cursor):
+        def differs(new):
+            # Empty cells are staged as '', which must not count as a change of a NULL column
+            return " OR ".join(f"IFNULL(F1.{column}, '') IS NOT {new}.{column}" for column in self.COLUMNS[1:])
+
+        cursor.execute("SELECT COUNT(*) FROM F1_import s WHERE NOT EXISTS (SELECT 1 FROM F1 WHERE F1.id = s.id)")
+        added = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COUNT(*) FROM F1_import s JOIN F1 ON F1.id = s.id WHERE {differs('s')}")
+        changed = cursor.fetchone()[0]
+
+        removed = 0
+        if self.delete_missing:
+            cursor.execute("SELECT COUNT(*) FROM F1 WHERE id NOT IN (SELECT id FROM F1_import)")
+            removed = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM F1 WHERE id NOT IN (SELECT id FROM F1_import)")
+
+        # Upsert touching only new or changed rows so the triggers keeping
+        # F1_fts and prix_cents in sync fire as little as possible
+        cursor.execute(f"""
+            INSERT INTO F1 (id, description, type, prix, marque)
+            SELECT id, description, type, prix, marque FROM F1_import WHERE true
+            ON CONFLICT(id) DO UPDATE SET
+                description = excluded.description,
+                type = excluded.type,
+                prix = excluded.prix,
+                marque = excluded.marque
+            WHERE {differs('excluded')}
+        """)
+        return {'added': added, 'changed': changed, 'removed': removed}
+
+
+class CatalogueExporter:
+    """Streams F1 (or the rows matching a search) to .xlsx, .csv or .parquet.
+
+    The cursor is read in chunks with fetchmany and each chunk is written
+    straight to the output (openpyxl write-only workbook, csv writer or a
+    pyarrow ParquetWriter), so the catalogue is never held in memory.
+    """
+
+    HEADERS = ['ID', 'Description', 'Type', 'Prix', 'Marque']
+    CHUNK_SIZE = 5000
+
+    def __init__(self, db, search_index, search_text="", progress=None):
+        self.db = db
+        self.search_index = search_index
+        self.search_text = search_text
+        self.progress = progress or (lambda done, total=None, message=None: None)
+
+    def _execute(self, cursor, make_query):
+        where, params = self.search_index.build_where(self.search_text)
+        try:
+            cursor.execute(*make_query(where, params))
+        except sqlite3.OperationalError as e:
+            if not self.search_index.fts_enabled:
+                raise
+            logging.warning(f"FTS query failed, falling back to LIKE search: {e}")
+            where, params = self.search_index.build_where(self.search_text, use_fts=False)
+            cursor.execute(*make_query(where, params))
+
+    def iter_chunks(self, conn):
+        """Yield (total_rows, rows) chunks ordered by id."""
+        cursor = conn.cursor()
+        self._execute(cursor, lambda where, params: (
+            f"SELECT COUNT(*) FROM F1{f' WHERE {where}' if where else ''}", params
+        ))
+        total = cursor.fetchone()[0]
+        self._execute(cursor, lambda where, params: (
+            f"SELECT id, description, type, prix, marque FROM F1"
+            f"{f' WHERE {where}' if where else ''} ORDER BY id", params
+        ))
+        while True:
+            rows = cursor.fetchmany(self.CHUNK_SIZE)
+            if not rows:
+                break
+            yield total, rows
+
+    def run(self, file_path):
+        extension = os.path.splitext(file_path)[1].lower()
+        with self.db.connection() as conn, metrics.timer("catalogue_export_seconds", format=extension.lstrip('.')):
+            if extension == '.csv':
+                exported = self._write_csv(conn, file_path)
+            elif extension == '.parquet':
+                exported = self._write_parquet(conn, file_path)
+            else:
+                exported = self._write_xlsx(conn, file_path)
+            logging.info(f"Exported {exported} rows to {file_path}")
+            return exported
+
+    def _report(self, exported, total):
+        self.progress(exported, total, f"Export... {exported}/{total} lignes")
+
+    def _write_xlsx(self, conn, file_path):
+        import openpyxl
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(self.HEADERS)
+        exported = 0
+        for total, rows in self.iter_chunks(conn):
+            for row in rows:
+                sheet.append(row)
+            exported += len(rows)
+            self._report(exported, total)
+        self.progress(exported, None, "Enregistrement du fichier...")
+        workbook.save(file_path)
+        return exported
+
+    def _write_csv(self, conn, file_path):
+        exported = 0
+        # utf-8-sig and ";" so Excel opens the file correctly with French settings
+        with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(self.HEADERS)
+            for total, rows in self.iter_chunks(conn):
+                writer.writerows(rows)
+                exported += len(rows)
+                self._report(exported, total)
+        return exported
+
+    def _write_parquet(self, conn, file_path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("L'export Parquet nécessite le module pyarrow")
+
+        schema = pa.schema([
+            ('ID', pa.int64()),
+            ('Description', pa.string()),
+            ('Type', pa.string()),
+            ('Prix', pa.string()),
+            ('Marque', pa.string()),
+        ])
+        exported = 0
+        with pq.ParquetWriter(file_path, schema) as writer:
+            for total, rows in self.iter_chunks(conn):
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                    schema=schema
+                ))
+                exported += len(rows)
+                self._report(exported, total)
+        return exported
+
+
+class ProductVersions:
+    """Versions of the F1 rows, used to price the order lines.
+
+    Every insert into F1 and every change of a product's description, type,
+    prix or marque adds a row to F1_history. Its version, a number increasing
+    over the whole catalogue, identifies that state of the product. Order
+    lines keep only the product id and version, so re-importing prices does
+    not change existing lines. History rows never change, so the resolved
+    versions are kept in an LRU without invalidation.
+    """
+
+    # Stay below the SQLite host parameter limit
+    CHUNK_SIZE = 500
+
+    def __init__(self, db, cache_size=4096):
+        self.db = db
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        with self.db.transaction() as conn:
+            self.setup(conn)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def setup(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS F1_history (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL,
+                description TEXT,
+                type TEXT,
+                prix TEXT,
+                marque TEXT,
+                prix_cents INTEGER
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_f1_history_product ON F1_history(product_id, version)")
+        snapshot = f"""
+            INSERT INTO F1_history (product_id, description, type, prix, marque, prix_cents)
+            VALUES (new.id, new.description, new.type, new.prix, new.marque, {PRIX_CENTS_SQL.format(col='new.prix')});
+        """
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS F1_history_ai AFTER INSERT ON F1 BEGIN {snapshot} END")
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS F1_history_au AFTER UPDATE OF id, description, type, prix, marque ON F1
+            WHEN old.id IS NOT new.id OR old.description IS NOT new.description OR old.type IS NOT new.type
+                OR old.prix IS NOT new.prix OR old.marque IS NOT new.marque
+            BEGIN {snapshot} END
+        """)
+        # Products written before the history existed start at their current state
+        conn.execute("""
+            INSERT INTO F1_history (product_id, description, type, prix, marque, prix_cents)
+            SELECT id, description, type, prix, marque, prix_cents FROM F1
+            WHERE NOT EXISTS (SELECT 1 FROM F1_history h WHERE h.product_id = F1.id)
+        """)
+
+    def current_versions(self, product_ids):
+        """{id: latest version} of the given products.
+
+        Ids no longer in F1 are left out, even though their history remains:
+        they may still be listed by a search made before the deletion.
+        """
+        ids = [int(product_id) for product_id in product_ids]
+        versions = {}
+        with self.db.connection() as conn:
+            for start in range(0, len(ids), self.CHUNK_SIZE):
+                chunk = ids[start:start + self.CHUNK_SIZE]
+                rows = conn.execute(
+                    f"SELECT h.product_id, MAX(h.version) FROM F1_history h JOIN F1 ON F1.id = h.product_id "
+                    f"WHERE h.product_id IN ({','.join('?' * len(chunk))}) GROUP BY h.product_id",
+                    chunk
+                ).fetchall()
+                versions.update((str(product_id), version) for product_id, version in rows)
+        return versions
+
+    def resolve(self, version):
+        """The product as it was at a version, as an F1 row (id, description, type, prix, marque, prix_cents)."""
+        return self.resolve_many([version])[version]
+
+    def resolve_many(self, versions):
+        """{version: F1 row} for several versions, reading only those not in the cache."""
+        found = {}
+        with self._lock:
+            for version in versions:
+                if version in self._cache:
+                    self._cache.move_to_end(version)
+                    found[version] = self._cache[version]
+        missing = [version for version in set(versions) if version not in found]
+        if missing:
+            with self.db.connection() as conn:
+                for start in range(0, len(missing), self.CHUNK_SIZE):
+                    chunk = missing[start:start + self.CHUNK_SIZE]
+                    for row in conn.execute(
+                            f"SELECT version, product_id, description, type, prix, marque, prix_cents "
+                            f"FROM F1_history WHERE version IN ({','.join('?' * len(chunk))})",
+                            chunk):
+                        found[row[0]] = row[1:]
+            with self._lock:
+                for version in missing:
+                    if version in found:
+                        self._cache[version] = found[version]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return found
+
+    def version_for_element(self, conn, element):
+        """Version matching a full product copy saved by earlier versions of the cart.
+
+        A history row is added when no version of the product has these values.
+        """
+        element = list(element) + [None] * (5 - len(element))
+        row = conn.execute("""
+            SELECT MAX(version) FROM F1_history
+            WHERE product_id = ? AND description IS ? AND type IS ? AND prix IS ? AND marque IS ?
+        """, (int(element[0]), element[1], element[2], element[3], element[4])).fetchone()
+        if row[0] is not None:
+            return row[0]
+        cursor = conn.execute(
+            "INSERT INTO F1_history (product_id, description, type, prix, marque, prix_cents) VALUES (?, ?, ?, ?, ?, ?)",
+            (int(element[0]), element[1], element[2], element[3], element[4], element_price_cents(element))
+        )
+        return cursor.lastrowid
+
+
+class OrderStore:
+    """Orders and their lines in SQLite.
+
+    Only the orders being edited are held in memory (see OrderCart); the
+    history is read a page at a time through OrderRowSource. Each line refers
+    to a product version of F1_history (see ProductVersions), so products
+    later changed or removed from the catalogue still show as ordered.
+    """
+
+    STATUS_LABELS = {'open': 'En cours', 'closed': 'Terminée'}
+
+    def __init__(self, db, products):
+        self.db = db
+        self.products = products
+        with self.db.transaction() as conn:
+            self.setup(conn)
+
+    def setup(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'open',
+                created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+                updated_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, created_at)")
+        # product_id is the F1 id; there is no foreign key because catalogue
+        # imports may delete products still listed in old orders
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_lines (
+                order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+                product_id INTEGER NOT NULL,
+                version INTEGER NOT NULL REFERENCES F1_history(version),
+                quantite INTEGER NOT NULL,
+                PRIMARY KEY (order_id, product_id)
+            )
+        """)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(order_lines)")]
+        if 'element' in columns:
+            self.migrate_line_elements(conn)
+
+    def migrate_line_elements(self, conn):
+        # Lines used to hold a JSON copy of the F1 row: replace it by a version
+        logging.info("Converting order lines to product versions")
+        rows = conn.execute(
+            "SELECT order_id, product_id, element, quantite FROM order_lines ORDER BY rowid"
+        ).fetchall()
+        conn.execute("ALTER TABLE order_lines RENAME TO order_lines_old")
+        self.setup(conn)
+        conn.executemany(
+            "INSERT INTO order_lines (order_id, product_id, version, quantite) VALUES (?, ?, ?, ?)",
+            [
+                (order_id, product_id, self.products.version_for_element(conn, json.loads(element)), quantite)
+                for order_id, product_id, element, quantite in rows
+            ]
+        )
+        conn.execute("DROP TABLE order_lines_old")
+
+    def create(self, name=None):
+        with self.db.transaction() as conn:
+            cursor = conn.execute("INSERT INTO orders (name) VALUES (?)", (name or "",))
+            order_id = cursor.lastrowid
+            if not name:
+                conn.execute("UPDATE orders SET name = ? WHERE id = ?", (f"Commande {order_id}", order_id))
+        return order_id
+
+    def get(self, order_id):
+        """(id, name, status, created_at, updated_at) of an order, or None."""
+        with self.db.connection() as conn:
+            return conn.execute(
+                "SELECT id, name, status, created_at, updated_at FROM orders WHERE id = ?", (order_id,)
+            ).fetchone()
+
+    def latest_open(self):
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT id FROM orders WHERE status = 'open' ORDER BY created_at DESC, id DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_status(self, order_id, status):
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE orders SET status = ?, updated_at = datetime('now', 'localtime') WHERE id = ?",
+                (status, order_id)
+            )
+
+    def is_empty(self):
+        with self.db.connection() as conn:
+            return conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone() is None
+
+    def import_legacy_cart(self, order_id, legacy_path='panier.json'):
+        """Copy the single cart of earlier versions (cart_lines table or panier.json) into an order."""
+        panier = {}
+        with self.db.connection() as conn:
+            has_cart_lines = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cart_lines'"
+            ).fetchone()
+            if has_cart_lines:
+                for id_produit, element, quantite in conn.execute(
+                        "SELECT id, element, quantite FROM cart_lines ORDER BY rowid"):
+                    panier[id_produit] = {'element': json.loads(element), 'quantite': quantite}
+        if not panier and os.path.exists(legacy_path):
+            try:
+                with open(legacy_path, 'r') as f:
+                    content = f.read()
+                panier = json.loads(content) if content.strip() else {}
+            except (OSError, ValueError) as e:
+                logging.error(f"Could not read {legacy_path}: {e}")
+        if not panier:
+            return
+
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO order_lines (order_id, product_id, version, quantite) VALUES (?, ?, ?, ?)",
+                [
+                    (order_id, int(id_produit), self.products.version_for_element(conn, line['element']), line['quantite'])
+                    for id_produit, line in panier.items()
+                ]
+            )
+        logging.info(f"Imported {len(panier)} cart lines into order {order_id}")
+
+
+class OrderLinesStore:
+    """Write-behind persistence of the lines of one order in the order_lines table.
+
+    Changes are recorded in memory and written together by a timer thread
+    at most once per flush interval; flush() is also called on exit. Only
+    the lines changed since the last flush are written. A lock serializes
+    the writes coming from the Tk and Socket.IO threads.
+    """
+
+    def __init__(self, db, order_id, flush_interval_ms=500):
+        self.db = db
+        self.order_id = order_id
+        self.flush_interval = flush_interval_ms / 1000
+        self.write_count = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._cleared = False
+        self._timer = None
+
+    def load(self):
+        try:
+            return self._load()
+        except Exception as e:
+            logging.error(f"Could not load cart, starting empty: {e}")
+            return {}
+
+    def line_changed(self, id_produit, line):
+        """Record a changed line (None when the product was removed)."""
+        with self._lock:
+            self._pending[id_produit] = None if line is None else dict(line)
+            self._schedule()
+
+    def cleared(self):
+        with self._lock:
+            self._pending.clear()
+            self._cleared = True
+            self._schedule()
+
+    def _schedule(self):
+        # Called with _lock held
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._pending and not self._cleared:
+                    return
+                pending, cleared = self._pending, self._cleared
+                self._pending, self._cleared = {}, False
+            try:
+                with metrics.timer("cart_write_seconds"):
+                    self._write(pending, cleared)
+                self.write_count += 1
+                metrics.inc("cart_writes_total")
+                metrics.inc("cart_lines_written_total", len(pending))
+            except Exception as e:
+                logging.error(f"Error saving cart, retrying later: {e}")
+                logging.error(traceback.format_exc())
+                with self._lock:
+                    # Put the changes back under those recorded since, which are newer
+                    if not self._cleared:
+                        self._pending = {**pending, **self._pending}
+                        self._cleared = cleared
+                    self._schedule()
+
+    def close(self):
+        self.flush()
+
+    def _load(self):
+        with self.db.connection() as conn:
+            # Lines keep their rowid on update, so rowid order is insertion order
+            rows = conn.execute(
+                "SELECT product_id, version, quantite FROM order_lines WHERE order_id = ? ORDER BY rowid",
+                (self.order_id,)
+            ).fetchall()
+        return {
+            str(product_id): {'version': version, 'quantite': quantite}
+            for product_id, version, quantite in rows
+        }
+
+    def _write(self, pending, cleared):
+        with self.db.transaction() as conn:
+            if cleared:
+                conn.execute("DELETE FROM order_lines WHERE order_id = ?", (self.order_id,))
+            removed = [(self.order_id, int(id_produit)) for id_produit, line in pending.items() if line is None]
+            changed = [
+                (self.order_id, int(id_produit), line['version'], line['quantite'])
+                for id_produit, line in pending.items() if line is not None
+            ]
+            if removed:
+                conn.executemany("DELETE FROM order_lines WHERE order_id = ? AND product_id = ?", removed)
+            if changed:
+                conn.executemany("""
+                    INSERT INTO order_lines (order_id, product_id, version, quantite) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(order_id, product_id) DO UPDATE
+                    SET version = excluded.version, quantite = excluded.quantite
+                """, changed)
+            conn.execute(
+                "UPDATE orders SET updated_at = datetime('now', 'localtime') WHERE id = ?", (self.order_id,)
+            )
+
+
+class OrderCart:
+    """Lines of one order, held in memory while the desktop or a phone edits it."""
+
+    def __init__(self, order_id, db, flush_interval_ms=500):
+        self.order_id = order_id
+        # Incremented on every change so clients can detect missed deltas
+        self.revision = 0
+        # Socket.IO sids of the phones showing this order
+        self.viewers = set()
+        self.store = OrderLinesStore(db, order_id, flush_interval_ms)
+        self.panier = self.store.load()
+
+    @property
+    def room(self):
+        return f"commande-{self.order_id}"
+
+
+class SocketServer:
+    """Serves the Flask/Socket.IO app from a background thread.
+
+    "threading" is the Werkzeug server with one thread per connection.
+    "eventlet" and "gevent" serve every connection from a single event loop;
+    they run without monkey patching so Tk and the worker threads stay real
+    threads. Emits from those threads are queued and sent by the loop itself.
+    """
+
+    MODES = ("threading", "eventlet", "gevent")
+    # How often the event loop sends the emits queued by other threads
+    PUMP_INTERVAL_S = 0.01
+
+    def __init__(self, app, socketio, mode, host, port, max_connections=200,
+                 keepalive_s=30, shutdown_timeout_s=5):
+        self.app = app
+        self.socketio = socketio
+        self.mode = mode
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.keepalive_s = keepalive_s
+        self.shutdown_timeout_s = shutdown_timeout_s
+        self.outbox = queue.Queue()
+        self.stopping = threading.Event()
+        self.server = None
+        self.thread = None
+
+    @staticmethod
+    def resolve_mode(mode):
+        """Return the mode to use, falling back to threading if it is not available."""
+        if mode not in SocketServer.MODES:
+            logging.warning(f"Unknown server_mode {mode!r}, using threading")
+            return "threading"
+        if mode != "threading":
+            try:
+                __import__(mode)
+            except ImportError:
+                logging.warning(f"{mode} is not installed, using threading")
+                return "threading"
+        return mode
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=getattr(self, f"_serve_{self.mode}"), name="socket-server", daemon=True
+        )
+        self.thread.start()
+        logging.info(f"Server started on port {self.port} ({self.mode} mode)")
+
+    def emit(self, event, data, to=None):
+        if metrics.enabled:
+            metrics.inc("socketio_emits_total", event=event)
+            metrics.inc("socketio_emit_bytes_total", len(json.dumps(data, separators=(',', ':'))), event=event)
+        if self.mode == "threading":
+            self.socketio.emit(event, data, to=to)
+        elif threading.current_thread() is self.thread:
+            # Send what other threads queued first so events keep their order
+            self._send_queued()
+            self.socketio.emit(event, data, to=to)
+        else:
+            self.outbox.put((event, data, to))
+
+    def stop(self):
+        """Stop accepting connections, close the clients and wait for the server thread.
+
+        Returns within about shutdown_timeout_s + 1 seconds, even if the
+        server thread is still running then (it is a daemon thread).
+        """
+        if self.thread is None:
+            return
+        deadline = time.monotonic() + self.shutdown_timeout_s
+        self.stopping.set()
+        if self.mode == "threading":
+            closer = threading.Thread(target=self._disconnect_clients, name="socket-close", daemon=True)
+            closer.start()
+            closer.join(self.shutdown_timeout_s)
+            if self.server is not None:
+                self.server.shutdown()
+        self.thread.join(max(deadline - time.monotonic(), 0) + 1)
+        if self.thread.is_alive():
+            logging.warning("Server did not stop within the shutdown timeout")
+
+    def _send_queued(self):
+        while True:
+            try:
+                event, data, to = self.outbox.get_nowait()
+            except queue.Empty:
+                return
+            self.socketio.emit(event, data, to=to)
+
+    def _pump(self, sleep):
+        # Runs inside the event loop until stop() is called
+        while not self.stopping.is_set():
+            self._send_queued()
+            sleep(self.PUMP_INTERVAL_S)
+        self._send_queued()
+        self._disconnect_clients()
+
+    def _disconnect_clients(self):
+        try:
+            self.socketio.server.shutdown()
+            eio = self.socketio.server.eio
+            # eio.disconnect() waits until each client has read its close
+            # packet, which a long-polling client between two polls never does
+            for client in list(eio.sockets.values()):
+                client.close(wait=False)
+            eio.sockets = {}
+        except Exception as e:
+            logging.warning(f"Error while disconnecting clients: {e}")
+
+    def _serve_threading(self):
+        from werkzeug.serving import make_server
+
+        self.server = make_server(self.host, self.port, self.app, threaded=True)
+        # Beyond max_connections, new connections wait in the listen backlog
+        slots = threading.BoundedSemaphore(self.max_connections)
+        process_request = self.server.process_request
+        process_request_thread = self.server.process_request_thread
+
+        def limited_process_request(request, client_address):
+            slots.acquire()
+            process_request(request, client_address)
+
+        def limited_process_request_thread(request, client_address):
+            try:
+                process_request_thread(request, client_address)
+            finally:
+                slots.release()
+
+        self.server.process_request = limited_process_request
+        self.server.process_request_thread = limited_process_request_thread
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+
+    def _serve_eventlet(self):
+        import eventlet
+        import eventlet.wsgi
+
+        listener = eventlet.listen((self.host, self.port))
+        pool = eventlet.GreenPool(self.max_connections)
+        self.server = eventlet.spawn(
+            eventlet.wsgi.server, listener, self.app,
+            custom_pool=pool, keepalive=self.keepalive_s, log_output=False
+        )
+        self._pump(eventlet.sleep)
+        self.server.kill()
+        listener.close()
+        with eventlet.Timeout(self.shutdown_timeout_s, False):
+            pool.waitall()
+
+    def _serve_gevent(self):
+        import gevent
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        try:
+            from geventwebsocket.handler import WebSocketHandler
+        except ImportError:
+            # engineio then handles the websocket upgrade with simple-websocket
+            WebSocketHandler = None
+
+        self.server = WSGIServer(
+            (self.host, self.port), self.app,
+            spawn=Pool(self.max_connections), log=None, handler_class=WebSocketHandler
+        )
+        self.server.start()
+        self._pump(gevent.sleep)
+        self.server.stop(timeout=self.shutdown_timeout_s)
+
+
+class StaticAssets:
+    """Fingerprinted, precompressed copies of the files in the static folder.
+
+    Every file is served as name.<hash>.ext, so it can be cached for a year:
+    a changed file gets a new URL. The gzip (and brotli, when the brotli
+    package is installed) variants are compressed once when loading.
+    """
+
+    URL_PREFIX = '/static/'
+    # One year, the longest lifetime browsers honour
+    CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+    def __init__(self, folder, fallback_urls=None):
+        self.folder = folder
+        self.fallback_urls = fallback_urls or {}
+        self.urls = {}
+        self.files = {}
+        self.load()
+
+    def load(self):
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+
+        for dirpath, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha1(data).hexdigest()[:12]
+                base, ext = os.path.splitext(name)
+                fingerprinted = f"{base}.{digest}{ext}"
+
+                variants = {'identity': data}
+                if len(data) >= GZIP_MIN_SIZE:
+                    variants['gzip'] = gzip.compress(data, compresslevel=9)
+                    if brotli is not None:
+                        variants['br'] = brotli.compress(data)
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                self.files[fingerprinted] = (mimetype, digest, variants)
+                self.urls[name] = self.URL_PREFIX + fingerprinted
+        logging.info(f"Loaded {len(self.files)} static assets from {self.folder}")
+        for name, url in self.fallback_urls.items():
+            if name not in self.urls:
+                logging.warning(f"{name} is not in {self.folder}: the phone page loads it from {url}")
+
+    def url(self, name):
+        """URL of a static file, or its fallback URL when it is not present."""
+        if name in self.urls:
+            return self.urls[name]
+        if name in self.fallback_urls:
+            return self.fallback_urls[name]
+        raise KeyError(f"Static file not found: {name}")
+
+    def local_urls(self):
+        return sorted(self.urls.values())
+
+    def response(self, app, request, fingerprinted):
+        """Response for a fingerprinted file in the best encoding the client accepts, or None."""
+        if fingerprinted not in self.files:
+            return None
+        mimetype, digest, variants = self.files[fingerprinted]
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        response = app.response_class(variants[encoding], mimetype=mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = self.CACHE_CONTROL
+        response.set_etag(f"{digest}-{encoding}")
+        return response.make_conditional(request)
+
+
+class ServiceCommandes:
+    """Catalogue, orders and phone server shared by the window and --headless.
+
+    Holds the orders being edited and applies every line change (desktop,
+    phones, API) under cart_lock: the change is persisted by the order's
+    write-behind store, broadcast to the phones of the order and reported
+    through on_current_lines_changed when it concerns current_cart, the
+    order shown on the desktop (or served on / in headless mode).
+    """
+
+    def __init__(self, settings=None, db_path='DB.db'):
+        self.settings = settings or load_settings()
+        # Before the database so its connections get the statement counter
+        metrics.enabled = self.settings["metrics_enabled"]
+
+        self.db_path = db_path
+        self.db = Database(
+            self.db_path,
+            pool_size=self.settings["db_pool_size"],
+            busy_timeout_ms=self.settings["db_busy_timeout_ms"]
+        )
+
+        # Orders being edited, by id: the current one and those opened by phones
+        self.carts = {}
+        self.current_cart = None
+        self.cart_lock = threading.RLock()
+        # Created by start_server()
+        self.app = None
+        self.socketio = None
+        self.server = None
+        # Order viewed by each connected phone, by Socket.IO sid
+        self.client_orders = {}
+        # Called with the ids of the changed lines of current_cart, from
+        # whichever thread made the change
+        self.on_current_lines_changed = None
+
+        self.setup_database()
+        self.register_metrics()
+        # The catalogue snapshot only serves the main window, which starts its build
+        if self.settings["fuzzy_search"]:
+            self.fuzzy_index.start_build()
+
+    def setup_database(self):
+        with self.db.transaction() as conn:
+            # Create table if it doesn't exist
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS F1 (
+                    id INTEGER PRIMARY KEY,
+                    description TEXT,
+                    type TEXT,
+                    prix TEXT,
+                    marque TEXT
+                )
+            ''')
+            self.migrate_prix_cents(conn)
+
+        self.products = ProductVersions(self.db, cache_size=self.settings["product_cache_size"])
+        self.orders = OrderStore(self.db, self.products)
+        self.search_index = SearchIndex(self.db)
+        self.search_cache = SearchCache(
+            self.search_index,
+            max_entries=self.settings["search_cache_size"],
+            narrow_max_rows=self.settings["search_cache_narrow_max_rows"]
+        )
+        self.catalogue = CatalogueSnapshot(
+            self.db,
+            self.search_index,
+            max_bytes=self.settings["catalogue_snapshot_max_mb"] * 1024 * 1024,
+            enabled=self.settings["catalogue_snapshot"]
+        )
+        self.fuzzy_index = FuzzyIndex(
+            self.db,
+            min_similarity=self.settings["fuzzy_min_similarity"],
+            limit=self.settings["fuzzy_max_results"]
+        )
+
+    def register_metrics(self):
+        # Values already tracked elsewhere, read when /metrics is rendered
+        metrics.register("socketio_clients", lambda: len(self.client_orders))
+        metrics.register("orders_loaded", lambda: len(self.carts))
+        metrics.register("search_cache_hits_total", lambda: self.search_cache.hits, kind="counter")
+        metrics.register("search_cache_narrowed_total", lambda: self.search_cache.narrowed, kind="counter")
+        metrics.register("search_cache_misses_total", lambda: self.search_cache.misses, kind="counter")
+        metrics.register("catalogue_snapshot_bytes", lambda: self.catalogue.stats()['bytes'])
+        metrics.register("catalogue_snapshot_bytes_per_row", lambda: self.catalogue.stats()['bytes_per_row'])
+
+    def migrate_prix_cents(self, conn):
+        # Numeric copy of the text price, maintained by triggers so every
+        # writer (dialogs, Excel import, API, other SQLite clients) keeps it in sync.
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(F1)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'prix_cents' not in columns:
+            logging.info("Adding prix_cents column to F1")
+            cursor.execute("ALTER TABLE F1 ADD COLUMN prix_cents INTEGER")
+            cursor.execute(f"UPDATE F1 SET prix_cents = {PRIX_CENTS_SQL.format(col='prix')}")
+
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'F1_prix_cents_ai'")
+        row = cursor.fetchone()
+        if row and PRIX_CENTS_SQL.format(col='new.prix') not in row[0]:
+            # Triggers of earlier versions either parsed thousands separators and
+            # currency codes differently or called a function only Database registered
+            logging.info("Recomputing prix_cents")
+            for trigger in ('F1_prix_cents_ai', 'F1_prix_cents_au', 'F1_history_ai', 'F1_history_au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('F1', 'F1_history')")
+            for (table,) in cursor.fetchall():
+                cursor.execute(
+                    f"UPDATE {table} SET prix_cents = {PRIX_CENTS_SQL.format(col='prix')} "
+                    f"WHERE prix_cents IS NOT {PRIX_CENTS_SQL.format(col='prix')}"
+                )
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS F1_prix_cents_ai AFTER INSERT ON F1 BEGIN
+                UPDATE F1 SET prix_cents = {PRIX_CENTS_SQL.format(col='new.prix')} WHERE id = new.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS F1_prix_cents_au AFTER UPDATE OF prix ON F1 BEGIN
+                UPDATE F1 SET prix_cents = {PRIX_CENTS_SQL.format(col='new.prix')} WHERE id = new.id;
+            END
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_f1_prix_cents ON F1(prix_cents)")
+
+    def setup_flask(self):
+        from flask import Flask, Response, render_template, request, abort, redirect, g
+        from flask_socketio import SocketIO, join_room
+
+        template_folder = get_resource_path(".")
+        # Static files are served fingerprinted by StaticAssets instead of Flask
+        self.app = Flask(__name__, template_folder=template_folder, static_folder=None)
+        self.assets = StaticAssets(get_resource_path("static"), STATIC_FALLBACK_URLS)
+        self.page_cache = {}
+        server_mode = SocketServer.resolve_mode(self.settings["server_mode"])
+        self.socketio = SocketIO(
+            self.app, 
+            cors_allowed_origins="*",
+            async_mode=server_mode,
+            ping_interval=self.settings["socketio_ping_interval_s"],
+            ping_timeout=self.settings["socketio_ping_timeout_s"]
+        )
+        self.server = SocketServer(
+            self.app,
+            self.socketio,
+            server_mode,
+            host='0.0.0.0',
+            port=self.settings["server_port"],
+            max_connections=self.settings["server_max_connections"],
+            keepalive_s=self.settings["server_keepalive_s"],
+            shutdown_timeout_s=self.settings["server_shutdown_timeout_s"]
+        )
+
+        def render_once(template, **context):
+            # The pages only change with the static assets, render them once
+            if template not in self.page_cache:
+                self.page_cache[template] = render_template(template, **context).encode('utf-8')
+            return self.page_cache[template]
+
+        def render_page():
+            return render_once('templates/edit_order.html', asset_url=self.assets.url)
+
+        def on_event(event):
+            # socketio.on() with the handler duration recorded per event
+            def register(handler):
+                def timed_handler(*args):
+                    with metrics.timer("socketio_event_seconds", event=event):
+                        return handler(*args)
+                return self.socketio.on(event)(timed_handler)
+            return register
+
+        if metrics.enabled:
+            @self.app.before_request
+            def start_request_timer():
+                g.request_started = time.perf_counter()
+
+            @self.app.after_request
+            def record_request_time(response):
+                started = g.pop('request_started', None)
+                if started is not None:
+                    metrics.observe(
+                        "http_request_seconds",
+                        time.perf_counter() - started,
+                        endpoint=request.endpoint or "none"
+                    )
+                return response
+
+        @self.app.route('/metrics')
+        def metrics_page():
+            if not metrics.enabled:
+                abort(404)
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+        @self.app.route('/')
+        def index():
+            return redirect(f'/commande/{self.current_cart.order_id}')
+
+        @self.app.route('/commande/<int:order_id>')
+        def order_page(order_id):
+            # The same page serves every order, it reads the id from its URL
+            if self.orders.get(order_id) is None:
+                abort(404)
+            return self.cached_response(render_page(), 'text/html')
+
+        @self.app.route('/sw.js')
+        def service_worker():
+            # A new page gives a new cache name, which drops the old cache
+            page_digest = hashlib.sha1(render_page()).hexdigest()[:12]
+            body = render_once(
+                'templates/sw.js',
+                cache_name=f"edit-order-{page_digest}",
+                assets=self.assets.local_urls()
+            )
+            return self.cached_response(body, 'application/javascript')
+
+        @self.app.route('/static/<path:filename>')
+        def static_file(filename):
+            response = self.assets.response(self.app, request, filename)
+            if response is None:
+                abort(404)
+            return response
+
+        self.setup_api()
+
+        @on_event('connect')
+        def handle_connect(auth=None):
+            if auth is not None and not isinstance(auth, dict):
+                return False
+            # Pages cached before orders existed do not send an order id
+            order_id = (auth or {}).get('order') or self.current_cart.order_id
+            with self.cart_lock:
+                try:
+                    cart = self.open_cart(int(order_id))
+                except (TypeError, ValueError, LookupError):
+                    return False
+                cart.viewers.add(request.sid)
+                self.client_orders[request.sid] = cart.order_id
+            join_room(cart.room)
+            self.send_cart_snapshot(request.sid, cart)
+
+        @on_event('disconnect')
+        def handle_disconnect(*args):
+            with self.cart_lock:
+                cart = self.client_cart(request.sid)
+                self.client_orders.pop(request.sid, None)
+                if cart is not None:
+                    cart.viewers.discard(request.sid)
+                    self.release_cart(cart)
+
+        @on_event('request_snapshot')
+        def handle_request_snapshot():
+            # Sent by clients that detected a gap in the delta revisions
+            cart = self.client_cart(request.sid)
+            if cart is not None:
+                self.send_cart_snapshot(request.sid, cart)
+
+        @on_event('update_panier')
+        def handle_panier_update(data):
+            # Single change sent by pages cached before update_panier_batch
+            try:
+                quantities = {str(int(data['id'])): int(data['quantite'])}
+            except (KeyError, TypeError, ValueError) as e:
+                logging.warning(f"Invalid cart update {data!r}: {e}")
+                return
+            cart = self.client_cart(request.sid)
+            if cart is not None:
+                self.apply_cart_quantities(quantities, cart)
+
+        @on_event('update_panier_batch')
+        def handle_panier_batch(data):
+            # [{id, quantite}, ...] collected by the page over a short window
+            try:
+                quantities = {str(int(change['id'])): int(change['quantite']) for change in data}
+            except (KeyError, TypeError, ValueError) as e:
+                logging.warning(f"Invalid cart update {data!r}: {e}")
+                return
+            cart = self.client_cart(request.sid)
+            if cart is not None:
+                self.apply_cart_quantities(quantities, cart)
+
+    def setup_api(self):
+        """Read-only JSON catalogue endpoints used by the phones."""
+        from flask import request
+
+        def product_json(row):
+            return dict(zip(('id', 'description', 'type', 'prix', 'marque', 'prix_cents'), row))
+
+        @self.app.route('/api/products')
+        def api_products():
+            search_text = request.args.get('q', '').strip().upper()
+            try:
+                limit = int(request.args.get('limit', API_DEFAULT_LIMIT))
+                cursor_arg = request.args.get('cursor')
+                after = tuple(int(v) for v in cursor_arg.split(':')) if cursor_arg else None
+                if limit < 1 or (after is not None and len(after) != 2):
+                    raise ValueError
+                if after is not None and after[0] == NULL_PRIX_CENTS:
+                    after = (None, after[1])
+            except ValueError:
+                return self.json_response({'error': 'paramètre limit ou cursor invalide'}, 400)
+            limit = min(limit, API_MAX_LIMIT)
+
+            if request.args.get('mode') == 'fuzzy':
+                # Ranked by closeness, in a single page
+                with self.db.connection() as conn:
+                    rows = self.fuzzy_index.search(conn.cursor(), search_text, limit)
+                return self.json_response({
+                    'items': [product_json(row) for row in rows],
+                    'next_cursor': None
+                })
+
+            with self.db.connection() as conn:
+                # One extra row tells whether there is a next page
+                rows = self.search_index.search_page(conn.cursor(), search_text, limit + 1, after)
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                prix_cents = NULL_PRIX_CENTS if rows[-1][5] is None else rows[-1][5]
+                next_cursor = f"{prix_cents}:{rows[-1][0]}"
+            return self.json_response({
+                'items': [product_json(row) for row in rows],
+                'next_cursor': next_cursor
+            })
+
+        @self.app.route('/api/products/<int:id_produit>')
+        def api_product(id_produit):
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT {F1_COLUMNS} FROM F1 WHERE id = ?", (id_produit,))
+                row = cursor.fetchone()
+            if row is None:
+                return self.json_response({'error': 'produit introuvable'}, 404)
+            return self.json_response(product_json(row))
+
+    def json_response(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return self.cached_response(body, 'application/json', status)
+
+    def cached_response(self, body, mimetype, status=200):
+        """Response with a weak ETag, answered by a 304 or gzip-compressed when possible."""
+        from flask import request
+
+        response = self.app.response_class(body, status=status, mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        if status != 200:
+            return response
+
+        # Weak so the same tag stays valid for the gzip and identity encodings
+        response.set_etag(hashlib.sha1(body).hexdigest(), weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.make_conditional(request)
+        if (response.status_code == 200 and len(body) >= GZIP_MIN_SIZE
+                and request.accept_encodings['gzip']):
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    @property
+    def panier(self):
+        """Lines of the current order."""
+        return self.current_cart.panier
+
+    def open_cart(self, order_id):
+        """The in-memory cart of an order, loaded on first use. LookupError if it does not exist."""
+        with self.cart_lock:
+            cart = self.carts.get(order_id)
+            if cart is None:
+                if self.orders.get(order_id) is None:
+                    raise LookupError(f"Unknown order {order_id}")
+                cart = OrderCart(order_id, self.db, self.settings["cart_flush_interval_ms"])
+                self.carts[order_id] = cart
+            return cart
+
+    def release_cart(self, cart):
+        # Unload an order nobody is editing any more, its lines are saved first
+        with self.cart_lock:
+            if cart is self.current_cart or cart.viewers:
+                return
+            self.carts.pop(cart.order_id, None)
+        cart.store.close()
+
+    def client_cart(self, sid):
+        with self.cart_lock:
+            return self.carts.get(self.client_orders.get(sid))
+
+    def set_current_order(self, order_id):
+        """Make another order the current one, unloading the previous one if unused."""
+        with self.cart_lock:
+            previous = self.current_cart
+            self.current_cart = self.open_cart(order_id)
+            if previous is not None and previous is not self.current_cart:
+                self.release_cart(previous)
+
+    def resume_order(self):
+        """Id of the most recent order still in progress, created if there is none."""
+        order_id = self.orders.latest_open()
+        if order_id is None:
+            first_start = self.orders.is_empty()
+            order_id = self.orders.create()
+            if first_start:
+                self.orders.import_legacy_cart(order_id)
+        return order_id
+
+    def cart_snapshot(self):
+        with self.cart_lock:
+            return dict(self.panier)
+
+    def line_values(self, line):
+        """(description, id, marque, quantite, prix, total) of an order line and its total in cents."""
+        element = self.products.resolve(line['version'])
+        quantity = line['quantite']
+        price = element_price_cents(element)
+
+        # Add safe access to marque with fallback
+        try:
+            marque = element[4] if len(element) > 4 else ""
+        except (IndexError, TypeError):
+            marque = ""
+
+        values = (
+            element[1],      # Description
+            element[0],      # ID
+            marque,         # Marque
+            quantity,       # Quantité
+            format_cents(price), # Prix
+            format_cents(quantity * price)  # Prix total
+        )
+        return values, quantity * price
+
+    def notify_current_lines(self, ids):
+        if self.on_current_lines_changed is not None:
+            self.on_current_lines_changed(ids)
+
+    def product_payload(self, versions):
+        """{id: [description, prix_cents]} sent once to the phones for each line version."""
+        return {
+            str(row[0]): [row[1], row[5]]
+            for row in self.products.resolve_many(versions).values()
+        }
+
+    def send_cart_snapshot(self, sid, cart):
+        order = self.orders.get(cart.order_id)
+        with self.cart_lock:
+            self.server.emit(
+                'panier_update',
+                {
+                    'order': {'id': order[0], 'name': order[1], 'status': order[2]},
+                    'revision': cart.revision,
+                    'panier': {id_produit: line['quantite'] for id_produit, line in cart.panier.items()},
+                    'products': self.product_payload([line['version'] for line in cart.panier.values()])
+                },
+                to=sid
+            )
+
+    def broadcast_cart_delta(self, cart, delta):
+        # Called with cart_lock held so deltas leave in revision order
+        cart.revision += 1
+        delta['revision'] = cart.revision
+        if self.server is not None:
+            self.server.emit('panier_delta', delta, to=cart.room)
+
+    def set_cart_line(self, id_produit, line, cart=None):
+        """Replace one line (None removes it) of an order, the desktop one by default."""
+        with self.cart_lock:
+            cart = cart or self.current_cart
+            if line is None:
+                if cart.panier.pop(id_produit, None) is None:
+                    return
+                delta = {'op': 'remove', 'id': id_produit}
+            else:
+                previous = cart.panier.get(id_produit)
+                cart.panier[id_produit] = line
+                delta = {'op': 'set', 'id': id_produit, 'quantite': line['quantite']}
+                # The phones already know the product unless the line is new
+                if previous is None or previous['version'] != line['version']:
+                    delta['product'] = self.product_payload([line['version']])[id_produit]
+            cart.store.line_changed(id_produit, line)
+            self.broadcast_cart_delta(cart, delta)
+            shown = cart is self.current_cart
+        if shown:
+            self.notify_current_lines([id_produit])
+
+    def set_cart_lines(self, changes, cart=None):
+        """Apply several line changes ({id: line or None}) as one persisted, broadcast delta."""
+        with self.cart_lock:
+            cart = cart or self.current_cart
+            applied = {}
+            new_versions = []
+            for id_produit, line in changes.items():
+                if line is None:
+                    if cart.panier.pop(id_produit, None) is None:
+                        continue
+                else:
+                    previous = cart.panier.get(id_produit)
+                    cart.panier[id_produit] = line
+                    if previous is None or previous['version'] != line['version']:
+                        new_versions.append(line['version'])
+                cart.store.line_changed(id_produit, line)
+                applied[id_produit] = line
+            if not applied:
+                return
+            self.broadcast_cart_delta(cart, {
+                'op': 'batch',
+                'lines': {
+                    id_produit: None if line is None else line['quantite']
+                    for id_produit, line in applied.items()
+                },
+                'products': self.product_payload(new_versions)
+            })
+            shown = cart is self.current_cart
+        if shown:
+            self.notify_current_lines(list(applied))
+
+    def add_cart_quantity(self, id_produit, quantite, cart=None):
+        """Add quantite of a product to an order; False when the product is not in F1."""
+        # Read outside the lock: the Socket.IO handlers wait on it
+        version = self.products.current_versions([id_produit]).get(id_produit)
+        if version is not None:
+            self.products.resolve(version)
+        with self.cart_lock:
+            cart = cart or self.current_cart
+            line = cart.panier.get(id_produit)
+            if line is not None:
+                line = dict(line, quantite=line['quantite'] + quantite)
+            elif version is not None:
+                line = {'version': version, 'quantite': quantite}
+            else:
+                return False
+            self.set_cart_line(id_produit, line, cart)
+        return True
+
+    def apply_cart_quantities(self, quantities, cart=None):
+        """Set the quantity of several products ({id: quantite}), 0 removing the line.
+
+        Existing lines keep their product version; new lines take the current
+        catalogue version of the product. Quantities outside 0..MAX_QUANTITE
+        are ignored.
+        """
+        versions = self.products.current_versions(
+            [id_produit for id_produit, quantite in quantities.items() if quantite > 0]
+        )
+        changes = {}
+        with self.cart_lock:
+            cart = cart or self.current_cart
+            for id_produit, quantite in quantities.items():
+                if not 0 <= quantite <= MAX_QUANTITE:
+                    logging.warning(f"Quantity {quantite} out of range for product {id_produit}, ignored")
+                    continue
+                if quantite == 0:
+                    changes[id_produit] = None
+                    continue
+                if id_produit in cart.panier:
+                    changes[id_produit] = dict(cart.panier[id_produit], quantite=quantite)
+                elif id_produit in versions:
+                    changes[id_produit] = {'version': versions[id_produit], 'quantite': quantite}
+                else:
+                    logging.warning(f"Unknown product {id_produit} in cart update, ignored")
+            self.set_cart_lines(changes, cart)
+
+    def start_server(self):
+        self.setup_flask()
+        self.server.start()
+
+    def serve_forever(self):
+        """Run the phone server without a window until SIGINT/SIGTERM (--headless)."""
+        import signal
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        if self.current_cart is None:
+            self.set_current_order(self.resume_order())
+        self.start_server()
+        logging.info(
+            f"Headless server on port {self.settings['server_port']}, "
+            f"order {self.current_cart.order_id} on /"
+        )
+        print(f"Serveur démarré sur le port {self.settings['server_port']} (Ctrl+C pour arrêter)")
+        try:
+            # wait() with a timeout so the signal handlers get to run on Windows
+            while not stop.wait(1):
+                pass
+        finally:
+            self.close()
+
+    def close(self):
+        # Stop the server first so no change arrives while the orders are saved
+        if self.server is not None:
+            self.server.stop()
+        for cart in list(self.carts.values()):
+            cart.store.close()
+        self.db.close_all()
@@ -0,0 +1,375 @@
+"""Headless benchmarks of the search, import/export, order and Socket.IO paths.
+
+Each catalogue size gets its own database with synthetic F1 rows. The
+results are printed (or written with --output) as JSON so runs can be
+compared. The Tk cart display is only timed with --tk, as it needs a display.
+
+    python benchmark.py
+    python benchmark.py --sizes 1000,10000,100000,1000000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+NOUNS = ["ROBINET", "VANNE", "COUDE", "TE", "MANCHON", "RACCORD", "TUBE", "JOINT",
+         "MITIGEUR", "SIPHON", "BOUCHON", "COLLIER", "CLAPET", "REDUCTION", "NIPPLE"]
+MATERIALS = ["LAITON", "CUIVRE", "PVC", "INOX", "PER", "MULTICOUCHE", "ACIER", "FONTE"]
+SIZES = ["12", "14", "15/21", "16", "20/27", "22", "26/34", "32", "33/42", "40", "50", "100"]
+TYPES = ["PLOMBERIE", "SANITAIRE", "CHAUFFAGE", "EVACUATION", "ROBINETTERIE"]
+BRANDS = ["GROHE", "HANSGROHE", "COMAP", "NICOLL", "GIRPI", "WATTS", "JACOB DELAFON", "THERMADOR"]
+
+# Keyword sets typed in the search field, from broad to narrow
+SEARCHES = ["", "ROB", "ROBINET", "ROBINET LAITON", "COUDE CUIVRE 22", "VANNE 20/27 COMAP", "INTROUVABLE"]
+# Mistyped or partial keywords, for the typo-tolerant search
+FUZZY_SEARCHES = ["ROBINNET", "MITIGEUR GROHEE", "COUDE CUIVR 22", "0001234"]
+
+# ServiceCommandes, imported by main() once in the benchmark directory
+SC = None
+
+# Largest catalogue exported/imported as .xlsx (openpyxl is slow beyond that)
+XLSX_MAX_ROWS = 100000
+
+
+def synthetic_rows(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        cents = rng.randint(50, 250000)
+        yield (
+            i,
+            f"{rng.choice(NOUNS)} {rng.choice(MATERIALS)} {rng.choice(SIZES)} REF{i:07d}",
+            rng.choice(TYPES),
+            f"{cents // 100},{cents % 100:02d} €",
+            rng.choice(BRANDS),
+        )
+
+
+def timed(func, runs=5):
+    """Run func several times; return the timings in ms and the last result."""
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, result
+
+
+class Benchmark:
+    def __init__(self, workdir, runs):
+        self.workdir = workdir
+        self.runs = runs
+        self.results = []
+
+    def record(self, size, name, case, timings, **extra):
+        entry = {
+            'size': size,
+            'name': name,
+            'case': case,
+            'runs': len(timings),
+            'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+        }
+        entry.update(extra)
+        self.results.append(entry)
+        print(f"{size:>9} {name:<22} {case:<28} {entry['median_ms']:>10.2f} ms", file=sys.stderr)
+
+    def skip(self, size, name, case, reason):
+        self.results.append({'size': size, 'name': name, 'case': case, 'skipped': reason})
+        print(f"{size:>9} {name:<22} {case:<28} skipped: {reason}", file=sys.stderr)
+
+    def headless_app(self, db_path):
+        """ServiceCommandes with its Flask app set up but not listening."""
+        # The trigram index and the snapshot are built by bench_search instead of in the background
+        app = SC.ServiceCommandes(dict(SC.DEFAULT_SETTINGS, server_mode="threading", fuzzy_search=False,
+                                       catalogue_snapshot=False), db_path)
+        app.set_current_order(app.orders.create("Benchmark"))
+        app.setup_flask()
+        return app
+
+    def run_size(self, size, tk_root=None):
+        db_path = os.path.join(self.workdir, f"bench_{size}.db")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        app = self.headless_app(db_path)
+        try:
+            # Goes through the same triggers (FTS, prix_cents, history) as an import
+            started = time.perf_counter()
+            with app.db.transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO F1 (id, description, type, prix, marque) VALUES (?, ?, ?, ?, ?)",
+                    synthetic_rows(size)
+                )
+            self.record(size, "catalogue_insert", f"{size} rows", [(time.perf_counter() - started) * 1000])
+
+            self.bench_search(size, app)
+            self.bench_import_export(size, app)
+            self.bench_cart(size, app, tk_root)
+            self.bench_socketio(size, app)
+        finally:
+            app.close()
+
+    def bench_search(self, size, app):
+        with app.db.connection() as conn:
+            cursor = conn.cursor()
+            for text in SEARCHES:
+                # What the main window runs for each search, without the cache
+                timings, rows = timed(
+                    lambda: app.search_index.search(cursor, text, "prix_cents, id"), self.runs
+                )
+                self.record(size, "search", text or "(vide)", timings, rows=len(rows))
+
+                def cached():
+                    app.search_cache.invalidate()
+                    app.search_cache.search(cursor, text, "prix_cents, id")
+                    return app.search_cache.search(cursor, text, "prix_cents, id")
+                timings, rows = timed(cached, self.runs)
+                self.record(size, "search_cached", text or "(vide)", timings, rows=len(rows))
+
+                timings, rows = timed(
+                    lambda: app.search_index.search_page(cursor, text, SC.API_DEFAULT_LIMIT + 1), self.runs
+                )
+                self.record(size, "api_search_page", text or "(vide)", timings, rows=len(rows))
+
+            # Typing "ROBINET LAITON 15" one key at a time, narrowed in memory
+            app.search_cache.invalidate()
+            typed = "ROBINET LAITON 15"
+            timings = []
+            for end in range(1, len(typed) + 1):
+                t, _ = timed(lambda: app.search_cache.search(cursor, typed[:end], "prix_cents, id"), 1)
+                timings.extend(t)
+            self.record(size, "search_typing", typed, timings, **app.search_cache.stats())
+
+            # The trigram index built from scratch, as at startup
+            timings, _ = timed(app.fuzzy_index.build, 1)
+            self.record(size, "fuzzy_index_build", f"{size} rows", timings, **app.fuzzy_index.stats())
+            for text in FUZZY_SEARCHES:
+                timings, rows = timed(lambda: app.fuzzy_index.search(cursor, text), self.runs)
+                self.record(size, "search_fuzzy", text, timings, rows=len(rows))
+
+            # The first search builds the columnar snapshot
+            app.catalogue.enabled = True
+            timings, _ = timed(lambda: app.catalogue.search(cursor, ""), 1)
+            if app.catalogue.enabled:
+                self.record(size, "snapshot_build", f"{size} rows", timings, **app.catalogue.stats())
+                for text in SEARCHES:
+                    timings, source = timed(lambda: app.catalogue.search(cursor, text), self.runs)
+                    self.record(size, "search_snapshot", text or "(vide)", timings, rows=source.count())
+            else:
+                self.skip(size, "search_snapshot", f"{size} rows", "numpy not installed or over catalogue_snapshot_max_mb")
+
+    def bench_import_export(self, size, app):
+        formats = ['csv', 'xlsx']
+        for fmt in formats:
+            if fmt == 'xlsx' and size > XLSX_MAX_ROWS:
+                self.skip(size, "export", fmt, f"more than {XLSX_MAX_ROWS} rows")
+                self.skip(size, "import", fmt, f"more than {XLSX_MAX_ROWS} rows")
+                continue
+            path = os.path.join(self.workdir, f"bench_{size}.{fmt}")
+            timings, _ = timed(lambda: SC.CatalogueExporter(app.db, app.search_index).run(path), 1)
+            self.record(size, "export", fmt, timings, bytes=os.path.getsize(path))
+
+            # Same file again: only the diff against F1 is applied
+            timings, counts = timed(lambda: SC.CatalogueImporter(app.db).run(path), 1)
+            self.record(size, "import_unchanged", fmt, timings, **counts)
+            os.remove(path)
+
+        # Price list where a tenth of the prices changed
+        path = os.path.join(self.workdir, f"bench_{size}_prices.csv")
+        rng = random.Random(7)
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            f.write("ID;Description;Type;Prix;Marque\n")
+            for row in synthetic_rows(size):
+                prix = row[3]
+                if rng.random() < 0.1:
+                    cents = rng.randint(50, 250000)
+                    prix = f"{cents // 100},{cents % 100:02d} €"
+                f.write(f"{row[0]};{row[1]};{row[2]};{prix};{row[4]}\n")
+        timings, counts = timed(lambda: SC.CatalogueImporter(app.db).run(path), 1)
+        self.record(size, "import_prices", "csv, 10% changed", timings, **counts)
+        os.remove(path)
+
+    def bench_cart(self, size, app, tk_root):
+        for lines in (100, 1000, 10000):
+            if lines > size:
+                continue
+            order_id = app.orders.create(f"Panier {lines}")
+            cart = app.open_cart(order_id)
+            quantities = {str(i): 1 + i % 5 for i in range(1, lines + 1)}
+
+            # Lines built from F1, one delta, one write-behind flush
+            timings, _ = timed(lambda: app.apply_cart_quantities(quantities, cart), 1)
+            self.record(size, "cart_apply", f"{lines} lines", timings)
+            # Write the lines still pending from cart_apply first
+            cart.store.flush()
+            timings, _ = timed(lambda: (cart.store.line_changed('1', cart.panier['1']), cart.store.flush()), 1)
+            self.record(size, "cart_save_one_line", f"{lines} lines", timings)
+            for id_produit, line in cart.panier.items():
+                cart.store.line_changed(id_produit, line)
+            timings, _ = timed(cart.store.flush, 1)
+            self.record(size, "cart_save_all", f"{lines} lines", timings)
+
+            timings, panier = timed(cart.store.load, self.runs)
+            self.record(size, "cart_load", f"{lines} lines", timings, lines=len(panier))
+
+            def display_values():
+                # update_cart_display without the Treeview, on a cold product cache
+                app.products.clear_cache()
+                app.products.resolve_many([line['version'] for line in panier.values()])
+                return [app.line_values(line) for line in panier.values()]
+            timings, _ = timed(display_values, self.runs)
+            self.record(size, "cart_display_values", f"{lines} lines", timings)
+
+            timings, payload = timed(
+                lambda: app.product_payload([line['version'] for line in panier.values()]), self.runs
+            )
+            self.record(size, "cart_snapshot_payload", f"{lines} lines", timings,
+                        bytes=len(json.dumps({'panier': {k: v['quantite'] for k, v in panier.items()},
+                                              'products': payload})))
+
+            if tk_root is not None:
+                self.bench_treeview(size, app, cart, tk_root, lines)
+
+            with app.cart_lock:
+                cart.viewers.clear()
+            app.release_cart(cart)
+
+    def bench_treeview(self, size, app, cart, tk_root, lines):
+        from tkinter import ttk
+        import GestionDeCommande as GC
+
+        # Only the cart table of the main window
+        window = GC.GestionCommandes.__new__(GC.GestionCommandes)
+        window.service = app
+        window.products = app.products
+        window.root = tk_root
+        window.treeview_panier = ttk.Treeview(tk_root, columns=tuple(range(6)), show="headings")
+        previous, app.current_cart = app.current_cart, cart
+        try:
+            def rebuild():
+                window.update_cart_display()
+                tk_root.update_idletasks()
+            timings, _ = timed(rebuild, self.runs)
+            self.record(size, "cart_treeview_rebuild", f"{lines} lines", timings)
+
+            def one_line():
+                window.refresh_cart_line('1')
+                tk_root.update_idletasks()
+            timings, _ = timed(one_line, self.runs)
+            self.record(size, "cart_treeview_one_line", f"{lines} lines", timings)
+        finally:
+            app.current_cart = previous
+            window.treeview_panier.destroy()
+
+    def bench_socketio(self, size, app):
+        for clients_count in (1, 10, 50):
+            clients = [
+                app.socketio.test_client(app.app, auth={'order': app.current_cart.order_id})
+                for _ in range(clients_count)
+            ]
+            for client in clients:
+                client.get_received()
+            sender = clients[0]
+
+            def round_trip(event, payload):
+                sender.emit(event, payload)
+                # The test client delivers synchronously: every client has the delta
+                return sum(len(client.get_received()) for client in clients)
+
+            counter = iter(range(1, 1000000))
+            timings, received = timed(
+                lambda: round_trip('update_panier', {'id': 1, 'quantite': next(counter)}), self.runs
+            )
+            self.record(size, "socketio_update", f"{clients_count} clients", timings, deliveries=received)
+
+            timings, received = timed(
+                lambda: round_trip('update_panier_batch', [
+                    {'id': i, 'quantite': next(counter)} for i in range(1, min(size, 50) + 1)
+                ]),
+                self.runs
+            )
+            self.record(size, "socketio_batch_50", f"{clients_count} clients", timings, deliveries=received)
+
+            timings, _ = timed(
+                lambda: app.socketio.test_client(app.app, auth={'order': app.current_cart.order_id}).disconnect(),
+                self.runs
+            )
+            self.record(size, "socketio_connect", f"{clients_count} clients", timings)
+
+            for client in clients:
+                client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="catalogue sizes, comma separated (default: 1000,10000,100000)")
+    parser.add_argument("--runs", type=int, default=5, help="repetitions of the short measurements")
+    parser.add_argument("--output", help="JSON file to write instead of the standard output")
+    parser.add_argument("--tk", action="store_true", help="also time the Treeview (needs a display)")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark databases")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="gestion_bench_")
+    # Keep the files the application writes (DB.db, panier.json) out of the repository
+    previous_dir = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    os.chdir(workdir)
+
+    global SC
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import ServiceCommandes as SC
+
+    tk_root = None
+    if args.tk:
+        import tkinter as tk
+        try:
+            tk_root = tk.Tk()
+            tk_root.withdraw()
+        except tk.TclError as e:
+            print(f"No display, Treeview benchmarks skipped: {e}", file=sys.stderr)
+
+    bench = Benchmark(workdir, args.runs)
+    try:
+        for size in sizes:
+            bench.run_size(size, tk_root)
+    finally:
+        os.chdir(previous_dir)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'sizes': sizes,
+            'runs': args.runs,
+            'workdir': workdir if args.keep else None,
+        },
+        'results': bench.results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,8 @@
 from cx_Freeze import setup, Executable
 import sys
-import os
-import numpy
-
-# Get numpy path
-numpy_path = os.path.dirname(numpy.__file__)
 
 build_exe_options = {
     "packages": [
-        "numpy",
-        "pandas",
         "flask",
         "flask_socketio",
         "engineio",
@@ -19,13 +12,10 @@ build_exe_options = {
         "pyperclip",
         "qrcode",
         "openpyxl",  # Add openpyxl package
-        "et_xmlfile"  # Required dependency for openpyxl
+        "et_xmlfile",  # Required dependency for openpyxl
+        "numpy"  # Catalogue snapshot and typo-tolerant search scoring
     ],
     "includes": [
-        "numpy.core._methods",
-        "numpy.lib.format",
-        "numpy.core._dtype_ctypes",
-        "numpy.core.numeric",
         "jinja2.ext",
         "tkinter.ttk",
         "openpyxl.cell",  # Add key openpyxl modules
@@ -36,13 +26,15 @@ build_exe_options = {
         ("Logo_DN.png", "Logo_DN.png"),
         ("Logo_DN.ico", "Logo_DN.ico"),
         ("templates/edit_order.html", "templates/edit_order.html"),
+        ("templates/sw.js", "templates/sw.js"),
+        ("static", "static"),
         ("Douzet.db", "Douzet.db"),
-        ("panier.json", "panier.json"),
-        (numpy_path, "numpy")
+        ("panier.json", "panier.json")
     ],
-    "excludes": [],
+    # pandas is no longer used by the import/export
+    "excludes": ["pandas"],
     "zip_include_packages": "*",
-    "zip_exclude_packages": ["numpy"],
+    "zip_exclude_packages": [],
     "include_msvcr": True
 }
 
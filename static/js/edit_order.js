@@ -0,0 +1,232 @@
+// Order shown by this page, from its /commande/<id> URL
+let orderMatch = window.location.pathname.match(/\/commande\/(\d+)/);
+let orderId = orderMatch ? parseInt(orderMatch[1]) : null;
+let socket = io({auth: {order: orderId}});
+// Quantity of each product id in the order
+let panier = {};
+// [description, prix_cents] of each product in the order, sent once per line
+let products = {};
+// Revision of the last cart state applied, -1 until the first snapshot
+let revision = -1;
+// The server sends a snapshot on every (re)connection
+let waitingSnapshot = true;
+
+// One table row per product id, patched in place
+let rows = new Map();
+// Ids changed since the last frame, or every id after a snapshot
+let dirtyIds = new Set();
+let renderAll = false;
+let frameRequested = false;
+
+// Quantity edits are sent together at most once per window
+const BATCH_DELAY_MS = 300;
+let pendingQuantities = new Map();
+let batchTimer = null;
+
+socket.on('connect', function() {
+    console.log('Connecté au serveur');
+});
+
+socket.on('disconnect', function() {
+    waitingSnapshot = true;
+});
+
+// Full cart snapshot, sent on connection and on request
+socket.on('panier_update', function(data) {
+    console.log('Réception panier complet:', data);
+    panier = data.panier || {};
+    products = data.products || {};
+    revision = data.revision;
+    if (data.order) {
+        document.title = data.order.name;
+        document.getElementById('order-name').textContent = data.order.name;
+    }
+    waitingSnapshot = false;
+    scheduleRender();
+});
+
+// Single cart change
+socket.on('panier_delta', function(delta) {
+    if (waitingSnapshot || delta.revision <= revision) {
+        // Already included in the snapshot we have or are waiting for
+        return;
+    }
+    if (delta.revision !== revision + 1) {
+        // Missed a change: resynchronize
+        console.log('Révision inattendue', delta.revision, 'attendue', revision + 1);
+        waitingSnapshot = true;
+        socket.emit('request_snapshot');
+        return;
+    }
+    revision = delta.revision;
+
+    if (delta.op === 'set') {
+        panier[delta.id] = delta.quantite;
+        if (delta.product) {
+            products[delta.id] = delta.product;
+        }
+        scheduleRender(delta.id);
+    } else if (delta.op === 'remove') {
+        delete panier[delta.id];
+        delete products[delta.id];
+        scheduleRender(delta.id);
+    } else if (delta.op === 'batch') {
+        Object.assign(products, delta.products);
+        for (let id in delta.lines) {
+            if (delta.lines[id] === null) {
+                delete panier[id];
+                delete products[id];
+            } else {
+                panier[id] = delta.lines[id];
+            }
+            scheduleRender(id);
+        }
+    }
+});
+
+// Patch the table once per animation frame, whatever the number of changes.
+// Without an id, every row is checked (after a snapshot).
+function scheduleRender(id) {
+    if (id === undefined) {
+        renderAll = true;
+    } else {
+        dirtyIds.add(String(id));
+    }
+    if (!frameRequested) {
+        frameRequested = true;
+        window.requestAnimationFrame(render);
+    }
+}
+
+function render() {
+    frameRequested = false;
+    if (renderAll) {
+        for (let id of rows.keys()) {
+            if (!(id in panier)) {
+                removeRow(id);
+            }
+        }
+        for (let id in panier) {
+            patchRow(id);
+        }
+    } else {
+        for (let id of dirtyIds) {
+            patchRow(id);
+        }
+    }
+    renderAll = false;
+    dirtyIds.clear();
+    updateTotal();
+}
+
+function lineCents(id) {
+    return (products[id][1] || 0) * panier[id];
+}
+
+function formatCents(cents) {
+    return `${(cents / 100).toFixed(2)} €`;
+}
+
+function createRow(id) {
+    let tr = document.createElement('tr');
+    let description = document.createElement('td');
+    description.className = 'fw-bold';
+    let quantityCell = document.createElement('td');
+    let input = document.createElement('input');
+    input.type = 'number';
+    input.className = 'form-control quantity-input';
+    input.min = '0';
+    input.max = '999';
+    input.addEventListener('change', function() {
+        updateQuantity(id, input.value);
+    });
+    quantityCell.appendChild(input);
+    let total = document.createElement('td');
+    total.className = 'text-end';
+    tr.append(description, quantityCell, total);
+    document.querySelector('#panier-table tbody').appendChild(tr);
+
+    let row = {tr: tr, description: description, input: input, total: total};
+    rows.set(id, row);
+    return row;
+}
+
+function removeRow(id) {
+    let row = rows.get(id);
+    if (row) {
+        row.tr.remove();
+        rows.delete(id);
+    }
+}
+
+function patchRow(id) {
+    if (!(id in panier)) {
+        removeRow(id);
+        return;
+    }
+    let quantite = panier[id];
+    let row = rows.get(id) || createRow(id);
+    let description = String(products[id][0]);
+    if (row.description.textContent !== description) {
+        row.description.textContent = description;
+    }
+    // Leave the field alone while the user is typing in it
+    if (document.activeElement !== row.input && row.input.value !== String(quantite)) {
+        row.input.value = quantite;
+    }
+    let total = formatCents(lineCents(id));
+    if (row.total.textContent !== total) {
+        row.total.textContent = total;
+    }
+}
+
+function updateTotal() {
+    let totalSum = 0;
+    for (let id in panier) {
+        totalSum += lineCents(id);
+    }
+    document.getElementById('total-amount').textContent = formatCents(totalSum);
+}
+
+function updateQuantity(id, quantite) {
+    quantite = parseInt(quantite);
+    if (isNaN(quantite) || quantite < 0) return;
+
+    // Only the last value typed within the window is sent
+    pendingQuantities.set(String(id), quantite);
+    if (batchTimer === null) {
+        batchTimer = setTimeout(sendQuantities, BATCH_DELAY_MS);
+    }
+}
+
+function sendQuantities() {
+    batchTimer = null;
+    let changes = [];
+    for (let [id, quantite] of pendingQuantities) {
+        changes.push({id: id, quantite: quantite});
+    }
+    pendingQuantities.clear();
+    if (changes.length > 0) {
+        socket.emit('update_panier_batch', changes);
+    }
+}
+
+// Reconnect as soon as the phone is back online or the page is shown again
+function reconnect() {
+    if (!socket.connected) {
+        socket.connect();
+    }
+}
+window.addEventListener('online', reconnect);
+document.addEventListener('visibilitychange', function() {
+    if (!document.hidden) {
+        reconnect();
+    }
+});
+
+// Keep the page and its assets available without network
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register('/sw.js').catch(function(error) {
+        console.log('Service worker non enregistré:', error);
+    });
+}
@@ -0,0 +1,50 @@
+// Service worker of the cart page. The page and its fingerprinted assets are
+// cached so the page opens without network; the Socket.IO client then
+// reconnects on its own once the server is reachable.
+const CACHE_NAME = {{ cache_name|tojson }};
+const ASSETS = {{ assets|tojson }};
+
+self.addEventListener('install', function(event) {
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(function(cache) { return cache.addAll(ASSETS); })
+            .then(function() { return self.skipWaiting(); })
+    );
+});
+
+self.addEventListener('activate', function(event) {
+    // Drop the caches of previous versions of the page
+    event.waitUntil(
+        caches.keys()
+            .then(function(names) {
+                return Promise.all(names
+                    .filter(function(name) { return name !== CACHE_NAME; })
+                    .map(function(name) { return caches.delete(name); }));
+            })
+            .then(function() { return self.clients.claim(); })
+    );
+});
+
+self.addEventListener('fetch', function(event) {
+    let url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+    if (url.pathname.startsWith('/static/')) {
+        // Fingerprinted assets never change: the cached copy is always current
+        event.respondWith(caches.match(event.request).then(function(cached) {
+            return cached || fetch(event.request);
+        }));
+    } else if (url.pathname.startsWith('/commande/')) {
+        // Network first so the page stays current, cached copy when offline
+        event.respondWith(fetch(event.request).then(function(response) {
+            if (response.ok) {
+                let copy = response.clone();
+                caches.open(CACHE_NAME).then(function(cache) { cache.put(event.request, copy); });
+            }
+            return response;
+        }).catch(function() {
+            return caches.match(event.request);
+        }));
+    }
+});
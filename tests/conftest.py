@@ -0,0 +1,49 @@
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ServiceCommandes as SC  # noqa: E402
+
+
+@pytest.fixture
+def settings():
+    # Background builds are started explicitly by the tests that need them
+    return dict(SC.DEFAULT_SETTINGS, fuzzy_search=False, catalogue_snapshot=False,
+                server_shutdown_timeout_s=2, cart_flush_interval_ms=1000)
+
+
+@pytest.fixture
+def service(tmp_path, settings):
+    service = SC.ServiceCommandes(settings, str(tmp_path / "test.db"))
+    yield service
+    service.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def insert_products(service, rows):
+    with service.db.transaction() as conn:
+        conn.executemany("INSERT INTO F1 (id, description, type, prix, marque) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+# Small catalogue with accents, punctuation, shared prefixes and NULL prices
+CATALOGUE = [
+    (1, "ROBINET 15/21 LAITON", "Robinetterie", "12,50 €", "COMAP"),
+    (2, "ROBINET 20/27 LAITON", "Robinetterie", "14,90 €", "COMAP"),
+    (3, "ROBINETTERIE ÉVIER MITIGEUR", "Robinetterie", "89,00 €", "GROHE"),
+    (4, "COUDE CUIVRE 22", "Raccord", "1,20 €", "NICOLL"),
+    (5, "COUDE CUIVRE 12", "Raccord", None, "NICOLL"),
+    (6, "VANNE À SPHÈRE 20/27", "Vanne", "9,99 €", "COMAP"),
+    (7, "MITIGEUR THERMOSTATIQUE", "Robinetterie", "1.234,00 €", "GROHE"),
+    (8, "TUBE PER 16", "Tube", None, None),
+    (9, "JOINT FIBRE 15/21", "Joint", "0,35 €", "GÉNÉRIQUE"),
+    (10, "ROBINET D'ARRÊT 12", "Robinetterie", "7,20 €", "COMAP"),
+]
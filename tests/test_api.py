@@ -0,0 +1,60 @@
+import gzip
+
+import pytest
+
+from conftest import CATALOGUE, insert_products
+
+
+@pytest.fixture
+def client(service):
+    service.set_current_order(service.orders.create("Test"))
+    service.setup_flask()
+    return service.app.test_client()
+
+
+def test_products_pages_through_null_prices(service, client):
+    rows = [(i, f"Robinet {i}", "T", None if i % 3 == 0 else f"{i % 7},50 €", "M") for i in range(1, 31)]
+    insert_products(service, rows)
+
+    seen = []
+    cursor = None
+    while True:
+        query = {'q': 'robinet', 'limit': 4}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/api/products', query_string=query)
+        assert response.status_code == 200
+        page = response.get_json()
+        seen.extend(item['id'] for item in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    with service.db.connection() as conn:
+        expected = [row[0] for row in conn.execute("SELECT id FROM F1 ORDER BY prix_cents, id")]
+    assert seen == expected
+    assert len(seen) == 30
+
+
+def test_products_rejects_bad_cursors(client):
+    assert client.get('/api/products?cursor=None:3').status_code == 400
+    assert client.get('/api/products?cursor=1:2:3').status_code == 400
+
+
+def test_products_responses_are_cacheable_and_compressed(service, client):
+    insert_products(service, [(i, f"Robinet {i}", "T", "1,00 €", "M") for i in range(1, 41)])
+    response = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(response.data)) > len(response.data)
+    etag = response.headers['ETag']
+
+    assert client.get('/api/products', headers={'If-None-Match': etag}).status_code == 304
+    with service.db.transaction() as conn:
+        conn.execute("UPDATE F1 SET prix = '2,00 €' WHERE id = 1")
+    assert client.get('/api/products', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_single_product(service, client):
+    insert_products(service, CATALOGUE)
+    assert client.get('/api/products/7').get_json()['prix_cents'] == 123400
+    assert client.get('/api/products/999').status_code == 404
@@ -0,0 +1,20 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_benchmark_runs_on_a_small_catalogue(tmp_path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, "benchmark.py", "--sizes", "300", "--runs", "1", "--output", str(output)],
+        cwd=ROOT, capture_output=True, text=True, check=True, timeout=120
+    )
+    results = json.loads(output.read_text())["results"]
+    names = {result["name"] for result in results}
+    assert {"search", "search_cached", "import_prices", "export", "cart_apply", "cart_save_one_line",
+            "socketio_update", "fuzzy_index_build"} <= names
+    for result in results:
+        assert result["size"] == 300
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+import ServiceCommandes as SC
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = SC.Database(str(tmp_path / "pool.db"), pool_size=2)
+    with db.transaction() as conn:
+        conn.execute("CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)")
+        conn.execute("INSERT INTO counter VALUES (1, 0)")
+    yield db
+    db.close_all()
+
+
+def value(db):
+    with db.connection() as conn:
+        return conn.execute("SELECT value FROM counter").fetchone()[0]
+
+
+def test_concurrent_transactions(db):
+    errors = []
+
+    def work():
+        try:
+            for _ in range(50):
+                with db.transaction() as conn:
+                    current = conn.execute("SELECT value FROM counter").fetchone()[0]
+                    conn.execute("UPDATE counter SET value = ?", (current + 1,))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    # BEGIN IMMEDIATE: no lost update between the read and the write
+    assert value(db) == 400
+
+
+def test_transaction_rolls_back_and_nests(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            conn.execute("UPDATE counter SET value = 5")
+            with db.transaction() as inner:
+                assert inner is conn
+            raise RuntimeError
+    assert value(db) == 0
+
+    with db.connection() as conn:
+        with db.connection() as again:
+            assert again is conn
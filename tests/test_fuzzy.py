@@ -0,0 +1,54 @@
+import random
+import sys
+
+import pytest
+
+import ServiceCommandes as SC
+from conftest import CATALOGUE, insert_products
+
+
+def fuzzy_ids(index, conn, text):
+    return [row[0] for row in index.search(conn.cursor(), text)]
+
+
+@pytest.fixture
+def catalogue(service):
+    rng = random.Random(7)
+    words = ["ROBINET", "VANNE", "COUDE", "CUIVRE", "LAITON", "MITIGEUR", "GROHE", "COMAP", "15/21", "22", "TE"]
+    rows = list(CATALOGUE) + [
+        (i, " ".join(rng.sample(words, 3)), "Divers", "1,00 €", rng.choice(["COMAP", "GROHE", None]))
+        for i in range(11, 400)
+    ]
+    insert_products(service, rows)
+    return service
+
+
+@pytest.mark.parametrize("text, first", [("ROBINNET LAITON 15/21", 1), ("MITIGEUR THERMOSTATIK", 7), ("SFERE", 6)])
+def test_typos_find_the_product(catalogue, text, first):
+    with catalogue.db.connection() as conn:
+        assert fuzzy_ids(catalogue.fuzzy_index, conn, text)[0] == first
+
+
+def test_python_scoring_ranks_like_numpy(catalogue, monkeypatch):
+    pytest.importorskip("numpy")
+    with_numpy = SC.FuzzyIndex(catalogue.db, limit=50)
+    with_numpy.build()
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    without_numpy = SC.FuzzyIndex(catalogue.db, limit=50)
+    without_numpy.build()
+    with catalogue.db.connection() as conn:
+        for text in ["ROBINNET", "COUDE CUIVR", "VANE 20/27", "MITIGUR GROHE", "LATON"]:
+            assert fuzzy_ids(with_numpy, conn, text) == fuzzy_ids(without_numpy, conn, text), text
+    assert with_numpy.stats()['numpy'] and not without_numpy.stats()['numpy']
+
+
+def test_index_follows_catalogue_changes(catalogue):
+    index = catalogue.fuzzy_index
+    with catalogue.db.connection() as conn:
+        assert 6 in fuzzy_ids(index, conn, "SPHERE")
+        with catalogue.db.transaction():
+            conn.execute("UPDATE F1 SET description = 'CLAPET ANTIRETOUR' WHERE id = 6")
+            conn.execute("DELETE FROM F1 WHERE id = 3")
+        assert 6 not in fuzzy_ids(index, conn, "SPHERE")
+        assert fuzzy_ids(index, conn, "CLAPE ANTIRETOUR")[0] == 6
+        assert 3 not in fuzzy_ids(index, conn, "EVIER")
@@ -0,0 +1,44 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from conftest import free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs SIGTERM")
+def test_headless_server_stops_on_sigterm(tmp_path):
+    port = free_port()
+    (tmp_path / "settings.json").write_text(json.dumps({
+        "server_port": port, "fuzzy_search": False, "catalogue_snapshot": False, "server_shutdown_timeout_s": 2
+    }))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "GestionDeCommande.py"), "--headless"],
+        cwd=tmp_path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    try:
+        assert "Serveur démarré" in process.stdout.readline()
+        for _ in range(50):
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/commande/1", timeout=2) as response:
+                    assert response.status == 200
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            pytest.fail("server not reachable")
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=10) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+    assert (tmp_path / "DB.db").exists()
@@ -0,0 +1,53 @@
+import pytest
+
+import ServiceCommandes as SC
+from conftest import CATALOGUE, insert_products
+
+
+def write_csv(path, lines):
+    path.write_text("\n".join(["ID;Description;Type;Prix;Marque"] + lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def catalogue(service):
+    with service.db.connection() as conn:
+        return conn.execute("SELECT id, description, type, prix, marque FROM F1 ORDER BY id").fetchall()
+
+
+@pytest.mark.parametrize("delete_missing", [False, True])
+def test_import_applies_a_diff(service, tmp_path, delete_missing):
+    insert_products(service, CATALOGUE[:3])
+    path = write_csv(tmp_path / "tarif.csv", [
+        "1;ROBINET 15/21 LAITON;Robinetterie;12,50 €;COMAP",
+        "2;ROBINET 20/27 LAITON;Robinetterie;15,90 €;COMAP",
+        "11;PURGEUR;Radiateur;2,10 €;COMAP",
+    ])
+    summary = SC.CatalogueImporter(service.db, delete_missing=delete_missing).run(path)
+    assert summary == {'added': 1, 'changed': 1, 'removed': 1 if delete_missing else 0, 'total': 3}
+
+    rows = dict((row[0], row) for row in catalogue(service))
+    assert rows[2][3] == "15,90 €" and rows[11][1] == "PURGEUR"
+    assert (3 in rows) != delete_missing
+    with service.db.connection() as conn:
+        assert conn.execute("SELECT prix_cents FROM F1 WHERE id = 2").fetchone()[0] == 1590
+
+
+def test_import_leaves_the_catalogue_untouched_on_a_bad_row(service, tmp_path):
+    insert_products(service, CATALOGUE)
+    before = catalogue(service)
+    path = write_csv(tmp_path / "tarif.csv", ["1;CHANGE;T;1 €;M", "abc;BAD;T;1 €;M"])
+    with pytest.raises(ValueError, match="Ligne 3"):
+        SC.CatalogueImporter(service.db).run(path)
+    assert catalogue(service) == before
+
+
+@pytest.mark.parametrize("extension", [".csv", ".xlsx"])
+def test_export_then_import_changes_nothing(service, tmp_path, extension):
+    if extension == ".xlsx":
+        pytest.importorskip("openpyxl")
+    insert_products(service, CATALOGUE)
+    path = str(tmp_path / f"export{extension}")
+    assert SC.CatalogueExporter(service.db, service.search_index).run(path) == len(CATALOGUE)
+
+    summary = SC.CatalogueImporter(service.db, delete_missing=True).run(path)
+    assert summary == {'added': 0, 'changed': 0, 'removed': 0, 'total': len(CATALOGUE)}
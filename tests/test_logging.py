@@ -0,0 +1,54 @@
+import json
+import logging
+
+import pytest
+
+import ServiceCommandes as SC
+
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_json_log_with_level_and_rotation(tmp_path, restore_logging):
+    log_file = tmp_path / "app.log"
+    listener = SC.setup_logging(dict(
+        SC.DEFAULT_SETTINGS, log_file=str(log_file), log_format="json", log_level="warning",
+        log_max_bytes=2000, log_backup_count=2
+    ))
+    try:
+        logging.info("not written")
+        for i in range(40):
+            logging.warning(f"stock bas n°{i}")
+        try:
+            raise ValueError("prix")
+        except ValueError:
+            logging.exception("échec")
+    finally:
+        listener.stop()
+
+    records = [json.loads(line) for line in log_file.read_text(encoding="utf-8").splitlines()]
+    assert records[-1]["level"] == "ERROR" and "ValueError: prix" in records[-1]["message"]
+    assert all(record["level"] != "INFO" for record in records)
+    assert (tmp_path / "app.log.1").exists() and (tmp_path / "app.log.2").exists()
+    assert not (tmp_path / "app.log.3").exists()
+
+
+def test_unknown_level_falls_back_to_info(tmp_path, restore_logging):
+    log_file = tmp_path / "app.log"
+    listener = SC.setup_logging(dict(SC.DEFAULT_SETTINGS, log_file=str(log_file), log_level="bavard"))
+    try:
+        logging.debug("not written")
+        logging.info("écrit")
+    finally:
+        listener.stop()
+    text = log_file.read_text(encoding="utf-8")
+    assert "Unknown log level 'bavard'" in text and "écrit" in text and "not written" not in text
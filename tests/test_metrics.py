@@ -0,0 +1,34 @@
+import re
+
+import ServiceCommandes as SC
+from conftest import CATALOGUE, insert_products
+
+
+def test_metrics_page_is_off_by_default(service):
+    service.set_current_order(service.orders.create("Test"))
+    service.setup_flask()
+    assert service.app.test_client().get('/metrics').status_code == 404
+
+
+def test_metrics_page(tmp_path, settings):
+    settings["metrics_enabled"] = True
+    service = SC.ServiceCommandes(settings, str(tmp_path / "test.db"))
+    try:
+        insert_products(service, CATALOGUE)
+        service.set_current_order(service.orders.create("Test"))
+        service.setup_flask()
+        client = service.app.test_client()
+        phone = service.socketio.test_client(service.app, auth={'order': service.current_cart.order_id})
+        phone.emit('update_panier_batch', [{'id': 1, 'quantite': 2}])
+        client.get('/api/products?q=robinet')
+
+        text = client.get('/metrics').get_data(as_text=True)
+        assert re.search(r'^gestion_socketio_clients 1$', text, re.M)
+        assert re.search(r'^gestion_db_statements_total\{kind="trigger"\} \d+', text, re.M)
+        assert re.search(r'^gestion_db_transaction_seconds_count \d+', text, re.M)
+        assert re.search(r'^gestion_http_request_seconds_count\{.*endpoint="api_products".*\} 1$', text, re.M)
+        assert re.search(r'^gestion_socketio_emits_total\{event="panier_delta"\} 1$', text, re.M)
+        assert '# TYPE gestion_search_cache_hits_total counter' in text
+    finally:
+        service.close()
+        SC.metrics.enabled = False
@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+import time
+
+import ServiceCommandes as SC
+
+from conftest import insert_products
+
+
+def lock_is_free(lock):
+    # Acquired from another thread, as a Socket.IO handler would
+    free = []
+    thread = threading.Thread(target=lambda: free.append(lock.acquire(timeout=0.5) and (lock.release() or True)))
+    thread.start()
+    thread.join()
+    return free == [True]
+
+
+def test_add_cart_quantity_reads_the_catalogue_outside_the_lock(service):
+    insert_products(service, [(1, "Robinet", "T", "12,50 €", "M")])
+    service.set_current_order(service.orders.create("Test"))
+    current_versions = service.products.current_versions
+    checks = []
+
+    def checked_current_versions(ids):
+        checks.append(lock_is_free(service.cart_lock))
+        return current_versions(ids)
+
+    service.products.current_versions = checked_current_versions
+    assert service.add_cart_quantity("1", 2)
+    assert service.add_cart_quantity("1", 3)
+    assert checks == [True, True]
+    assert service.panier["1"]["quantite"] == 5
+
+
+def test_add_cart_quantity_refuses_unknown_products(service):
+    service.set_current_order(service.orders.create("Test"))
+    assert not service.add_cart_quantity("42", 1)
+    assert service.panier == {}
+
+
+def test_order_lines_are_written_behind_and_coalesced(service):
+    insert_products(service, [(1, "Robinet", "T", "12,50 €", "M"), (2, "Vanne", "T", "3,00 €", "M")])
+    order_id = service.orders.create("Test")
+    service.set_current_order(order_id)
+    store = service.current_cart.store
+    for quantity in range(1, 6):
+        service.apply_cart_quantities({"1": quantity, "2": quantity})
+    service.apply_cart_quantities({"2": 0})
+    store.flush()
+    assert store.write_count == 1
+
+    with service.db.connection() as conn:
+        assert conn.execute(
+            "SELECT product_id, quantite FROM order_lines WHERE order_id = ?", (order_id,)
+        ).fetchall() == [(1, 5)]
+    assert store.load() == {"1": {"version": service.panier["1"]["version"], "quantite": 5}}
+
+
+def test_deleted_products_cannot_be_added(service):
+    insert_products(service, [(1, "Robinet", "T", "12,50 €", "M"), (2, "Vanne", "T", "3,00 €", "M")])
+    service.set_current_order(service.orders.create("Test"))
+    with service.db.transaction() as conn:
+        conn.execute("DELETE FROM F1 WHERE id = 2")
+
+    assert set(service.products.current_versions(["1", "2"])) == {"1"}
+    assert not service.add_cart_quantity("2", 1)
+    service.apply_cart_quantities({"1": 1, "2": 3})
+    assert set(service.panier) == {"1"}
+
+
+def test_lines_keep_the_price_they_were_added_at(service):
+    insert_products(service, [(1, "Robinet", "T", "12,50 €", "M")])
+    service.set_current_order(service.orders.create("Test"))
+    service.add_cart_quantity("1", 2)
+    with service.db.transaction() as conn:
+        conn.execute("UPDATE F1 SET prix = '15,00 €' WHERE id = 1")
+
+    values, total = service.line_values(service.panier["1"])
+    assert values[4:] == ("12.50€", "25.00€") and total == 2500
+    # A new line takes the current version
+    service.set_current_order(service.orders.create("Suivante"))
+    service.add_cart_quantity("1", 1)
+    assert service.line_values(service.panier["1"])[1] == 1500
+
+
+def test_pending_lines_are_written_by_the_timer_and_on_close(service, tmp_path, settings):
+    insert_products(service, [(1, "Robinet", "T", "12,50 €", "M"), (2, "Vanne", "T", "3,00 €", "M")])
+    order_id = service.orders.create("Test")
+    service.set_current_order(order_id)
+    store = service.current_cart.store
+    store.flush_interval = 0.05
+    service.add_cart_quantity("1", 1)
+    for _ in range(100):
+        if store.write_count:
+            break
+        time.sleep(0.01)
+    assert store.write_count == 1
+
+    store.flush_interval = 60
+    service.add_cart_quantity("2", 4)
+    service.close()
+    reopened = SC.ServiceCommandes(settings, service.db_path)
+    try:
+        reopened.set_current_order(order_id)
+        assert {id_produit: line['quantite'] for id_produit, line in reopened.panier.items()} == {'1': 1, '2': 4}
+    finally:
+        reopened.close()
+
+
+def test_failed_writes_are_retried(service):
+    insert_products(service, [(1, "Robinet", "T", "12,50 €", "M"), (2, "Vanne", "T", "3,00 €", "M")])
+    order_id = service.orders.create("Test")
+    service.set_current_order(order_id)
+    store = service.current_cart.store
+    write = store._write
+    failures = []
+
+    def failing_write(pending, cleared):
+        if not failures:
+            failures.append(pending)
+            raise sqlite3.OperationalError("database is locked")
+        write(pending, cleared)
+
+    store._write = failing_write
+    service.add_cart_quantity("1", 1)
+    service.add_cart_quantity("2", 1)
+    store.flush()
+    assert failures and store.write_count == 0
+    # Changed again before the retry: the newer quantity wins
+    service.apply_cart_quantities({"2": 7})
+    store.flush()
+    with service.db.connection() as conn:
+        assert conn.execute(
+            "SELECT product_id, quantite FROM order_lines WHERE order_id = ? ORDER BY product_id", (order_id,)
+        ).fetchall() == [(1, 1), (2, 7)]
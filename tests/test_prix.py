@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+import ServiceCommandes as SC
+from conftest import insert_products
+
+PRICES = [
+    ("12,50 €", 1250),
+    ("1.234,50 €", 123450),
+    ("12,50 EUR", 1250),
+    ("1 234,00 €", 123400),
+    ("1\xa0234,00 €", 123400),
+    ("1 234 567,8", 123456780),
+    ("1,234.56", 123456),
+    ("12,505 €", 1251),
+    ("12.5", 1250),
+    ("-3,5", -350),
+    (12.5, 1250),
+    (7, 700),
+    ("", 0),
+    ("sur devis", 0),
+]
+# Prices read the same way by the triggers, beyond the common formats above
+UNUSUAL_PRICES = ["12 € HT", "EUR 12,50", "12,50 €/u", "1'234.50", "(12,50)", "Prix: 12,50", "12.", ".5",
+                  "1.234.567", "1,2,3.4", "0,125", "0,12345", "--3", "3-", "-"]
+
+
+@pytest.mark.parametrize("prix, cents", PRICES)
+def test_prix_to_cents(prix, cents):
+    assert SC.prix_to_cents(prix) == cents
+
+
+def test_triggers_use_the_same_parser(service):
+    rows = [(i, f"Produit {i}", "T", prix, "M") for i, (prix, _) in enumerate(PRICES, 1)]
+    rows.append((len(rows) + 1, "Sans prix", "T", None, "M"))
+    insert_products(service, rows)
+    with service.db.connection() as conn:
+        stored = dict(conn.execute("SELECT id, prix_cents FROM F1").fetchall())
+        history = dict(conn.execute("SELECT product_id, prix_cents FROM F1_history").fetchall())
+        for i, (prix, cents) in enumerate(PRICES, 1):
+            assert stored[i] == history[i] == cents, prix
+        assert stored[len(rows)] is None
+
+        conn.execute("UPDATE F1 SET prix = '1.000,01 €' WHERE id = 1")
+        assert conn.execute("SELECT prix_cents FROM F1 WHERE id = 1").fetchone()[0] == 100001
+
+
+@pytest.mark.parametrize("prix", UNUSUAL_PRICES)
+def test_sql_parser_matches_prix_to_cents(prix):
+    conn = sqlite3.connect(":memory:")
+    assert conn.execute(f"SELECT {SC.PRIX_CENTS_SQL.format(col='?')}", (prix,)).fetchone()[0] == SC.prix_to_cents(prix)
+
+
+def test_other_sqlite_clients_can_write_the_catalogue(service):
+    insert_products(service, [(1, "Robinet", "T", "12,50 €", "M")])
+    conn = sqlite3.connect(service.db.path)
+    try:
+        with conn:
+            conn.execute("UPDATE F1 SET prix = '1 234,50 €' WHERE id = 1")
+            conn.execute("INSERT INTO F1 (id, description, type, prix, marque) VALUES (2, 'Vanne', 'T', '3,5', 'M')")
+        assert conn.execute("SELECT id, prix_cents FROM F1 ORDER BY id").fetchall() == [(1, 123450), (2, 350)]
+        assert conn.execute(
+            "SELECT product_id, prix_cents FROM F1_history ORDER BY version"
+        ).fetchall() == [(1, 1250), (1, 123450), (2, 350)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("old_sql", [
+    "CAST(ROUND(CAST(REPLACE(REPLACE(new.prix, '€', ''), ',', '.') AS REAL) * 100) AS INTEGER)",
+    # Needed a Python function registered on the connection
+    "prix_to_cents(new.prix)",
+])
+def test_outdated_triggers_are_replaced(tmp_path, settings, old_sql):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(f"""
+        CREATE TABLE F1 (id INTEGER PRIMARY KEY, description TEXT, type TEXT, prix TEXT, marque TEXT,
+                         prix_cents INTEGER);
+        INSERT INTO F1 VALUES (1, 'Robinet', 'T', '1.234,50 €', 'M', 123);
+        CREATE TRIGGER F1_prix_cents_ai AFTER INSERT ON F1 BEGIN
+            UPDATE F1 SET prix_cents = {old_sql} WHERE id = new.id;
+        END;
+    """)
+    conn.close()
+
+    service = SC.ServiceCommandes(settings, path)
+    try:
+        with service.db.connection() as conn:
+            assert conn.execute("SELECT prix_cents FROM F1").fetchone()[0] == 123450
+        insert_products(service, [(2, "Vanne", "T", "12,50 EUR", "M")])
+        with service.db.connection() as conn:
+            assert conn.execute("SELECT prix_cents FROM F1 WHERE id = 2").fetchone()[0] == 1250
+    finally:
+        service.close()
+
+
+@pytest.mark.parametrize("cents, text", [(0, "0.00€"), (1250, "12.50€"), (-150, "-1.50€"), (-5, "-0.05€")])
+def test_format_cents(cents, text):
+    assert SC.format_cents(cents) == text
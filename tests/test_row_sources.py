@@ -0,0 +1,18 @@
+import pytest
+
+from conftest import CATALOGUE, insert_products
+from GestionDeCommande import QueryRowSource
+
+
+@pytest.mark.parametrize("order_by", ["id", "prix_cents, id"])
+@pytest.mark.parametrize("text", ["", "ROBINET", "20/27"])
+def test_query_row_source_pages_like_one_query(service, order_by, text):
+    insert_products(service, CATALOGUE)
+    with service.db.connection() as conn:
+        expected = service.search_index.search(conn.cursor(), text, order_by)
+    source = QueryRowSource(service.db, service.search_index, text, order_by=order_by, page_size=3, max_pages=2)
+    assert source.count() == len(expected)
+    # Forward, then backward over pages evicted from the cache
+    assert source.fetch(0, len(expected)) == expected
+    for offset in reversed(range(len(expected))):
+        assert source.fetch(offset, 2) == expected[offset:offset + 2]
@@ -0,0 +1,72 @@
+import pytest
+
+from conftest import CATALOGUE, insert_products
+
+
+@pytest.fixture
+def cursor(service):
+    insert_products(service, CATALOGUE)
+    with service.db.connection() as conn:
+        yield conn.cursor()
+
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ROB 15", [1]),
+    ("robinet laiton", [1, 2]),
+    ("EVIER", [3]),
+    ("sphere comap", [6]),
+    ("20/27", [2, 6]),
+    ("ARRET", [10]),
+    ("NET", []),
+    ("", list(range(1, 11))),
+])
+def test_keywords_match_token_prefixes(service, cursor, text, expected):
+    assert service.search_index.fts_enabled
+    assert sorted(ids(service.search_index.search(cursor, text))) == expected
+
+
+def test_index_follows_updates_and_deletes(service, cursor):
+    with service.db.transaction() as conn:
+        conn.execute("UPDATE F1 SET description = 'VANNE LAITON' WHERE id = 1")
+        conn.execute("DELETE FROM F1 WHERE id = 2")
+    assert ids(service.search_index.search(cursor, "LAITON")) == [1]
+    assert ids(service.search_index.search(cursor, "ROBINET 15")) == []
+
+
+def test_python_filter_matches_sql(service, cursor):
+    index = service.search_index
+    for text in ["ROB", "ROBINET LAITON", "20/27", "CUIVRE 2", "É", "D'ARR", "MITIGEUR"]:
+        expected = set(ids(index.search(cursor, text)))
+        found = {
+            row[0] for row in CATALOGUE
+            if all(index.keyword_matches(keyword, row, index.row_tokens(row)) for keyword in text.split())
+        }
+        assert found == expected, text
+
+
+def test_cache_narrows_refinements_like_a_fresh_search(service, cursor):
+    cache = service.search_cache
+    typed = "ROBINET LAITON 15"
+    for end in range(1, len(typed) + 1):
+        text = typed[:end]
+        assert cache.search(cursor, text, "prix_cents, id") == service.search_index.search(
+            cursor, text, "prix_cents, id"), text
+    assert cache.narrowed > 0
+
+    # Punctuation keywords use LIKE, which a cached prefix does not cover
+    for text in ["20", "20/", "20/27"]:
+        assert ids(cache.search(cursor, text, "prix_cents, id")) == ids(
+            service.search_index.search(cursor, text, "prix_cents, id")), text
+
+
+def test_cache_is_invalidated_by_catalogue_changes(service, cursor):
+    cache = service.search_cache
+    assert ids(cache.search(cursor, "VANNE", "id")) == [6]
+    with service.db.transaction() as conn:
+        conn.execute("INSERT INTO F1 (id, description, type, prix, marque) VALUES (11, 'VANNE', 'Vanne', '1', 'X')")
+    cache.invalidate()
+    assert ids(cache.search(cursor, "VANNE", "id")) == [6, 11]
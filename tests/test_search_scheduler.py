@@ -0,0 +1,39 @@
+import queue
+
+from GestionDeCommande import SearchScheduler
+
+
+class FakeRoot:
+    """Stands in for Tk: callbacks are run by the test thread."""
+
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def after(self, delay_ms, func, *args):
+        self.calls.put((func, args))
+
+    def after_cancel(self, after_id):
+        pass
+
+    def process(self, timeout=5):
+        func, args = self.calls.get(timeout=timeout)
+        func(*args)
+
+
+def test_worker_survives_a_failing_search(service):
+    def search(cursor, search_text):
+        if search_text == "boom":
+            raise IndexError("index 3 is out of bounds")
+        return [search_text]
+
+    root = FakeRoot()
+    results, errors = [], []
+    scheduler = SearchScheduler(root, service.db, search, results.append, on_error=errors.append)
+
+    scheduler.run_now("boom")
+    root.process()
+    assert errors == ["boom"] and results == []
+
+    scheduler.run_now("robinet")
+    root.process()
+    assert results == [["robinet"]]
@@ -0,0 +1,75 @@
+import pytest
+
+import ServiceCommandes as SC
+from conftest import CATALOGUE, insert_products
+
+pytest.importorskip("numpy")
+
+SEARCHES = ["", "ROB", "ROBINET", "robinet laiton", "ROBINET 15", "COUDE CUIVRE", "evier", "SPHÈRE COMAP",
+            "GENERIQUE", "D'ARRET", "15 21", "INTROUVABLE"]
+
+
+@pytest.fixture
+def snapshot(service):
+    insert_products(service, CATALOGUE)
+    return SC.CatalogueSnapshot(service.db, service.search_index)
+
+
+def check_parity(service, snapshot):
+    with service.db.connection() as conn:
+        cursor = conn.cursor()
+        for text in SEARCHES:
+            source = snapshot.search(cursor, text)
+            expected = service.search_index.search(cursor, text, "prix_cents, id")
+            assert source.count() == len(expected), text
+            assert source.fetch(0, len(expected)) == expected, text
+            assert source.fetch(1, 2) == expected[1:3], text
+
+
+def test_results_match_sqlite_in_price_order(service, snapshot):
+    check_parity(service, snapshot)
+    assert snapshot.stats()['rows'] == len(CATALOGUE)
+
+
+def test_snapshot_follows_inserts_updates_and_deletes(service, snapshot):
+    check_parity(service, snapshot)
+    with service.db.transaction() as conn:
+        conn.execute("INSERT INTO F1 (id, description, type, prix, marque) VALUES (11, 'ROBINET NEUF', 'R', NULL, 'X')")
+        conn.execute("UPDATE F1 SET description = 'COUDE LAITON', prix = '0,10 €' WHERE id = 5")
+        conn.execute("DELETE FROM F1 WHERE id = 2")
+    snapshot.invalidate()
+    check_parity(service, snapshot)
+    assert snapshot.stats()['rows'] == len(CATALOGUE)
+
+
+def test_falls_back_to_sqlite(service, snapshot):
+    with service.db.connection() as conn:
+        # Punctuation-only keywords are answered by the LIKE filter
+        assert snapshot.search(conn.cursor(), "20/27 -") is None
+        too_small = SC.CatalogueSnapshot(service.db, service.search_index, max_bytes=100)
+        assert too_small.search(conn.cursor(), "ROB") is None
+        assert not too_small.enabled
+        disabled = SC.CatalogueSnapshot(service.db, service.search_index, enabled=False)
+        assert disabled.search(conn.cursor(), "ROB") is None
+
+
+def test_oversized_catalogue_is_not_built(service, monkeypatch):
+    insert_products(service, CATALOGUE)
+
+    def extend(*args, **kwargs):
+        raise AssertionError("snapshot built")
+
+    monkeypatch.setattr(SC._SnapshotState, "extend", extend)
+    limit = len(CATALOGUE) * SC.CatalogueSnapshot.BYTES_PER_ROW_ESTIMATE - 1
+    oversized = SC.CatalogueSnapshot(service.db, service.search_index, max_bytes=limit)
+    with service.db.connection() as conn:
+        assert oversized.search(conn.cursor(), "ROB") is None
+    assert not oversized.enabled
+
+
+def test_service_leaves_the_build_to_the_main_window(tmp_path, settings, monkeypatch):
+    builds = []
+    monkeypatch.setattr(SC.CatalogueSnapshot, "start_build", lambda self: builds.append(self))
+    service = SC.ServiceCommandes(dict(settings, catalogue_snapshot=True), str(tmp_path / "DB.db"))
+    service.close()
+    assert builds == []
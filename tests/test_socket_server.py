@@ -0,0 +1,46 @@
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import ServiceCommandes as SC
+from conftest import free_port
+
+
+def polling_client(port):
+    """Connect a Socket.IO client over long-polling that then stops polling."""
+    url = f"http://127.0.0.1:{port}/socket.io/?EIO=4&transport=polling"
+    for _ in range(50):
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                handshake = response.read().decode()
+            break
+        except OSError:
+            time.sleep(0.1)
+    url += "&sid=" + json.loads(handshake[1:])['sid']
+    urllib.request.urlopen(urllib.request.Request(url, data=b"40", method="POST"), timeout=2).read()
+    with urllib.request.urlopen(url, timeout=2) as response:
+        assert b"panier_update" in response.read()
+
+
+@pytest.mark.parametrize("mode", SC.SocketServer.MODES)
+def test_stop_with_an_idle_polling_client(tmp_path, settings, mode):
+    if SC.SocketServer.resolve_mode(mode) != mode:
+        pytest.skip(f"{mode} is not installed")
+    port = free_port()
+    settings.update(server_mode=mode, server_port=port, socketio_ping_interval_s=1, socketio_ping_timeout_s=2)
+    service = SC.ServiceCommandes(settings, str(tmp_path / "test.db"))
+    service.set_current_order(service.orders.create("Test"))
+    service.start_server()
+    polling_client(port)
+
+    started = time.monotonic()
+    closer = threading.Thread(target=service.close, daemon=True)
+    closer.start()
+    closer.join(settings["server_shutdown_timeout_s"] + 2)
+    assert not closer.is_alive()
+    assert time.monotonic() - started <= settings["server_shutdown_timeout_s"] + 1.5
+    assert not service.server.thread.is_alive()
+    assert not service.client_orders
@@ -0,0 +1,99 @@
+import pytest
+
+from conftest import CATALOGUE, insert_products
+
+
+@pytest.fixture
+def order_id(service):
+    order_id = service.orders.create("Test")
+    service.set_current_order(order_id)
+    service.setup_flask()
+    return order_id
+
+
+@pytest.mark.parametrize("auth", ["commande", ["order", 1], {"order": "abc"}, {"order": [1]}])
+def test_connect_refuses_invalid_auth(service, order_id, auth):
+    client = service.socketio.test_client(service.app, auth=auth)
+    assert not client.is_connected()
+    assert not service.client_orders
+
+
+def test_connect_joins_the_requested_order(service, order_id):
+    client = service.socketio.test_client(service.app, auth={'order': order_id})
+    assert client.is_connected()
+    received = client.get_received()
+    assert received[0]['name'] == 'panier_update'
+    assert received[0]['args'][0]['order']['id'] == order_id
+    client.disconnect()
+    assert not service.client_orders
+
+
+def events(client, name):
+    return [event['args'][0] for event in client.get_received() if event['name'] == name]
+
+
+def test_changes_are_sent_as_revisioned_deltas(service, order_id):
+    insert_products(service, CATALOGUE)
+    phone = service.socketio.test_client(service.app, auth={'order': order_id})
+    other = service.socketio.test_client(service.app, auth={'order': order_id})
+    phone.get_received()
+    other.get_received()
+
+    phone.emit('update_panier', {'id': 1, 'quantite': 2})
+    service.set_cart_line("1", dict(service.panier["1"], quantite=3))
+    service.set_cart_line("1", None)
+    deltas = events(other, 'panier_delta')
+    assert [delta['revision'] for delta in deltas] == [1, 2, 3]
+    assert deltas[0] == {'op': 'batch', 'lines': {'1': 2}, 'products': {'1': ["ROBINET 15/21 LAITON", 1250]},
+                         'revision': 1}
+    # The product is only sent with the first line of a version
+    assert deltas[1] == {'op': 'set', 'id': '1', 'quantite': 3, 'revision': 2}
+    assert deltas[2] == {'op': 'remove', 'id': '1', 'revision': 3}
+
+    other.emit('request_snapshot')
+    snapshot = events(other, 'panier_update')[0]
+    assert snapshot['revision'] == 3 and snapshot['panier'] == {}
+
+
+def test_batched_phone_edits_make_one_delta(service, order_id):
+    insert_products(service, CATALOGUE)
+    phone = service.socketio.test_client(service.app, auth={'order': order_id})
+    phone.emit('update_panier_batch', [{'id': 1, 'quantite': 2}, {'id': 4, 'quantite': 10}, {'id': 99, 'quantite': 1}])
+    phone.emit('update_panier_batch', [{'id': 4, 'quantite': 0}, {'id': 1, 'quantite': 5}])
+    phone.emit('update_panier_batch', [{'id': 'x'}])
+    deltas = events(phone, 'panier_delta')
+    assert [delta['lines'] for delta in deltas] == [{'1': 2, '4': 10}, {'4': None, '1': 5}]
+    assert {id_produit: line['quantite'] for id_produit, line in service.panier.items()} == {'1': 5}
+
+
+def test_out_of_range_quantities_are_ignored(service, order_id):
+    insert_products(service, CATALOGUE)
+    phone = service.socketio.test_client(service.app, auth={'order': order_id})
+    phone.emit('update_panier_batch', [{'id': 1, 'quantite': 10 ** 20}, {'id': 2, 'quantite': -1}, {'id': 4, 'quantite': 999}])
+    phone.emit('update_panier', {'id': 1, 'quantite': 1000})
+    assert [delta['lines'] for delta in events(phone, 'panier_delta')] == [{'4': 999}]
+    service.current_cart.store.flush()
+    assert {id_produit: line['quantite'] for id_produit, line in service.panier.items()} == {'4': 999}
+
+
+def test_each_order_has_its_own_room(service, order_id):
+    insert_products(service, CATALOGUE)
+    other_order = service.orders.create("Chantier")
+    desktop_phone = service.socketio.test_client(service.app, auth={'order': order_id})
+    phone = service.socketio.test_client(service.app, auth={'order': other_order})
+    desktop_phone.get_received()
+    phone.get_received()
+
+    service.add_cart_quantity("1", 1)
+    phone.emit('update_panier_batch', [{'id': 4, 'quantite': 3}])
+    assert [delta['lines'] for delta in events(phone, 'panier_delta')] == [{'4': 3}]
+    assert [delta.get('id') for delta in events(desktop_phone, 'panier_delta')] == ['1']
+    assert set(service.panier) == {'1'}
+
+    # The other order is saved and unloaded once its last viewer leaves
+    phone.disconnect()
+    assert other_order not in service.carts
+    with service.db.connection() as conn:
+        assert conn.execute(
+            "SELECT product_id, quantite FROM order_lines WHERE order_id = ?", (other_order,)
+        ).fetchall() == [(4, 3)]
@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["ServiceCommandes", "GestionDeCommande"])
+def test_heavy_modules_are_not_imported_at_startup(module):
+    heavy = ("flask", "flask_socketio", "numpy", "openpyxl", "pyarrow", "eventlet", "gevent")
+    code = f"import sys, {module}; print(' '.join(m for m in {heavy!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
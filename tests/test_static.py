@@ -0,0 +1,41 @@
+import gzip
+import re
+
+import pytest
+
+
+@pytest.fixture
+def client(service):
+    service.set_current_order(service.orders.create("Test"))
+    service.setup_flask()
+    return service.app.test_client()
+
+
+def test_page_uses_fingerprinted_assets(service, client):
+    page = client.get(f'/commande/{service.current_cart.order_id}').get_data(as_text=True)
+    css = re.search(r'href="(/static/css/edit_order\.[0-9a-f]{12}\.css)"', page).group(1)
+    assert re.search(r'src="/static/js/edit_order\.[0-9a-f]{12}\.js"', page)
+    # The Socket.IO client is served locally, not from the CDN
+    assert re.search(r'src="/static/vendor/socket\.io\.min\.[0-9a-f]{12}\.js"', page)
+
+    response = client.get(css, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b"{" in gzip.decompress(response.data)
+    headers = {'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}
+    assert client.get(css, headers=headers).status_code == 304
+
+
+def test_unknown_assets_and_orders(service, client):
+    assert client.get('/static/css/edit_order.000000000000.css').status_code == 404
+    assert client.get('/static/css/edit_order.css').status_code == 404
+    assert client.get('/commande/999').status_code == 404
+    assert client.get('/').headers['Location'].endswith(f'/commande/{service.current_cart.order_id}')
+
+
+def test_service_worker_lists_the_local_assets(service, client):
+    body = client.get('/sw.js').get_data(as_text=True)
+    for url in service.assets.local_urls():
+        assert url in body
+    assert 'cdn.socket.io' not in body